@@ -0,0 +1,54 @@
+""" Compares loading a large config file with and without its compiled code cached.
+
+Usage:
+    python -m benchmarks.config_load [--keys 20000] [--repeat 20]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import timeit
+
+from common.config import Config
+from common.config import _code_cache_path
+
+
+def write_config(directory, num_keys):
+    """ Writes a generated stage file with num_keys settings and returns its name. """
+    filename = "generated.py"
+    with open(os.path.join(directory, filename), "w") as config_file:
+        for num in range(num_keys):
+            config_file.write(f"SETTING_{num} = dict(name='setting {num}', values=[{num}, {num} * 2], on=True)\n")
+    return filename
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--keys", type=int, default=20000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args(argv)
+    sys.dont_write_bytecode = False
+
+    with tempfile.TemporaryDirectory() as directory:
+        filename = write_config(directory, args.keys)
+        cache_path = _code_cache_path(os.path.join(directory, filename))
+
+        def load():
+            Config(config_root=directory).from_pyfile(filename)
+
+        def cold_load():
+            if os.path.exists(cache_path):
+                os.unlink(cache_path)
+            load()
+
+        cold = min(timeit.repeat(cold_load, number=1, repeat=args.repeat))
+        load()
+        warm = min(timeit.repeat(load, number=1, repeat=args.repeat))
+
+    print(f"{args.keys} keys, best of {args.repeat}")
+    print(f"cold (compile): {cold * 1000:8.2f} ms")
+    print(f"warm (cached):  {warm * 1000:8.2f} ms  ({cold / warm:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
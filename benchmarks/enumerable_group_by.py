@@ -0,0 +1,49 @@
+""" Finds where group_by(parallel=True) starts to beat the sequential version.
+
+For each number of values and cost of the key function, prints the
+sequential and parallel times and the speedup.
+
+Usage:
+    python -m benchmarks.enumerable_group_by [--workers 4] [--sizes 1000 10000 100000] [--costs 0 100 1000]
+"""
+import argparse
+import hashlib
+import time
+from functools import partial
+
+from common.enumerable import group_by
+
+
+def expensive_key(value, cost):
+    """ Hashes value cost times (a stand-in for parsing or normalizing it). """
+    digest = str(value).encode()
+    for _ in range(cost):
+        digest = hashlib.blake2b(digest, digest_size=16).digest()
+    return digest[0] % 64
+
+
+def _time(func):
+    start = time.perf_counter()
+    func()
+    return time.perf_counter() - start
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--costs", type=int, nargs="+", default=[0, 10, 100, 1000])
+    args = parser.parse_args(argv)
+
+    print(f"{'values':>8} {'cost':>6} {'sequential':>11} {'parallel':>11} {'speedup':>8}")
+    for size in args.sizes:
+        values = list(range(size))
+        for cost in args.costs:
+            func = partial(expensive_key, cost=cost)
+            sequential = _time(lambda: group_by(func, values))
+            parallel = _time(lambda: group_by(func, values, parallel=True, workers=args.workers))
+            print(f"{size:>8} {cost:>6} {sequential:>10.3f}s {parallel:>10.3f}s {sequential / parallel:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+""" Drives Dataset against a FakeGeckoboard and reports throughput and latency.
+
+Example:
+    report = run_load_test(num_rows=100000, concurrency=8, latency=0.005)
+    print(report)
+
+Or from the command line:
+    python -m benchmarks.geckoboard_loadtest --rows 100000 --concurrency 8 --latency 0.005
+"""
+import argparse
+import math
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime
+from datetime import timedelta
+
+from common.enumerable import each_slice
+from common.geckoboard import Dataset
+from common.geckoboard import Field
+from common.geckoboard import Types
+from common.geckoboard.fake_server import FakeGeckoboard
+from common.geckoboard.scheduler import RequestScheduler
+
+LOAD_TEST_SCHEMA = dict(
+    timestamp=Field(Types.DATETIME, required=True, unique=True),
+    tpl=Field(Types.STRING, required=True),
+    num_orders=Field(Types.NUMBER),
+)
+
+
+def percentile(values, fraction):
+    """ The value at fraction (0 to 1) of the way through the sorted values (nearest rank). """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[max(math.ceil(fraction * len(ordered)) - 1, 0)]
+
+
+@dataclass
+class LoadTestReport:
+    """ The results of run_load_test.  Latencies are in seconds, as seen by the client. """
+    rows: int
+    requests: int
+    retries: int
+    bytes_sent: int
+    seconds: float
+    p50_latency: float
+    p99_latency: float
+    rows_received: int
+
+    @property
+    def requests_per_second(self):
+        return self.requests / self.seconds if self.seconds else 0.0
+
+    def __str__(self):
+        return (
+            f"{self.rows} rows in {self.seconds:.3f}s: {self.requests} requests "
+            f"({self.requests_per_second:.1f}/s, {self.retries} retries), {self.bytes_sent} bytes sent, "
+            f"latency p50={self.p50_latency * 1000:.2f}ms p99={self.p99_latency * 1000:.2f}ms"
+        )
+
+
+def generate_rows(num_rows, start=datetime(2020, 1, 1)):
+    for num in range(num_rows):
+        yield dict(timestamp=start + timedelta(seconds=num), tpl=str(num % 50), num_orders=num % 7)
+
+
+def run_load_test(
+    num_rows: int = 10000,
+    batch_size: int = Dataset.MAX_APPEND_RECORDS,
+    concurrency: int = 4,
+    latency: float = 0.0,
+    throttle_every: int = 0,
+    compress: bool = False,
+    rate: float = 100000.0,
+    dataset_class=Dataset,
+):
+    """ Appends num_rows to a fresh dataset on a FakeGeckoboard.
+
+    Args:
+        num_rows: How many rows to send.
+        batch_size: Rows per append call.
+        concurrency: How many threads append at once.
+        latency: Seconds the fake server waits before answering.
+        throttle_every: Every nth request is answered with a 429.
+        compress: Whether to gzip the request bodies.
+        rate: Requests per second allowed by the client-side scheduler.
+        dataset_class: Dataset or a subclass of it to drive.
+
+    Returns:
+        (LoadTestReport)
+    """
+    api_key = f"loadtest-{uuid.uuid4().hex}"
+    scheduler = RequestScheduler.configure(api_key, rate=rate, burst=max(rate, 1), backoff=0.001)
+    max_records = max(num_rows, FakeGeckoboard.MAX_RECORDS)
+    with FakeGeckoboard(latency=latency, throttle_every=throttle_every, max_records=max_records) as server:
+        dataset = server.dataset_class(dataset_class)('loadtest.dataset', api_key=api_key, compress=compress)
+        dataset.create_schema(LOAD_TEST_SCHEMA)
+        num_setup_requests = len(server.requests)
+
+        def append(batch):
+            batch_start = time.monotonic()
+            dataset.append(batch)
+            return time.monotonic() - batch_start
+
+        start = time.monotonic()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            latencies = list(executor.map(append, each_slice(batch_size, generate_rows(num_rows))))
+        seconds = time.monotonic() - start
+
+        requests = server.requests[num_setup_requests:]
+        return LoadTestReport(
+            rows=num_rows,
+            requests=len(requests),
+            retries=scheduler.stats.retries,
+            bytes_sent=sum(request.num_bytes for request in requests),
+            seconds=seconds,
+            p50_latency=percentile(latencies, 0.5),
+            p99_latency=percentile(latencies, 0.99),
+            rows_received=len(server.datasets['loadtest.dataset']['data']),
+        )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=10000, help="number of rows to append")
+    parser.add_argument("--batch-size", type=int, default=Dataset.MAX_APPEND_RECORDS, help="rows per request")
+    parser.add_argument("--concurrency", type=int, default=4, help="number of appending threads")
+    parser.add_argument("--latency", type=float, default=0.0, help="server latency in seconds")
+    parser.add_argument("--throttle-every", type=int, default=0, help="answer every nth request with a 429")
+    parser.add_argument("--compress", action="store_true", help="gzip request bodies")
+    args = parser.parse_args(argv)
+
+    report = run_load_test(
+        num_rows=args.rows,
+        batch_size=args.batch_size,
+        concurrency=args.concurrency,
+        latency=args.latency,
+        throttle_every=args.throttle_every,
+        compress=args.compress,
+    )
+    print(report)
+
+
+if __name__ == "__main__":
+    main()
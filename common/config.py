@@ -1,16 +1,171 @@
 """ Code to automatically load config files. """
 import errno
+import marshal
 import os
+import pickle
+import struct
+import sys
+import tempfile
+import threading
 import types
+from collections import ChainMap
+from importlib.util import MAGIC_NUMBER
+from types import MappingProxyType
 from types import ModuleType
 
 from common.config_utils import find_repo_root
 from common.import_utils import import_string
 
 
+# magic number, source mtime_ns, source size
+_CODE_CACHE_HEADER = struct.Struct("<4sQQ")
+
+
+def _code_cache_path(filename):
+    """ Where the compiled code for the config file filename is cached. """
+    directory, basename = os.path.split(filename)
+    name = os.path.splitext(basename)[0]
+    return os.path.join(directory, "__pycache__", f"{name}.{sys.implementation.cache_tag}.config.pyc")
+
+
+def _read_code_cache(cache_path, stat):
+    """ Returns the cached code if it was compiled from a source matching stat, otherwise None. """
+    try:
+        with open(cache_path, "rb") as cache_file:
+            data = cache_file.read()
+    except OSError:
+        return None
+    header = (MAGIC_NUMBER, stat.st_mtime_ns, stat.st_size)
+    if len(data) < _CODE_CACHE_HEADER.size or _CODE_CACHE_HEADER.unpack_from(data) != header:
+        return None
+    try:
+        return marshal.loads(data[_CODE_CACHE_HEADER.size:])
+    except (EOFError, ValueError, TypeError):
+        return None
+
+
+def _write_code_cache(cache_path, stat, code):
+    """ Atomically caches code compiled from a source matching stat.  Failures are ignored. """
+    if sys.dont_write_bytecode:
+        return
+    data = _CODE_CACHE_HEADER.pack(MAGIC_NUMBER, stat.st_mtime_ns, stat.st_size) + marshal.dumps(code)
+    try:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        _atomic_write(cache_path, data)
+    except OSError:
+        pass
+
+
+def _atomic_write(path, data):
+    """ Writes data to a temp file next to path, then renames it over path. """
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as tmp_file:
+            tmp_file.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def compile_config_file(filename):
+    """ Returns the code object for the config file filename.
+
+    Like imported modules, the compiled code is cached in `__pycache__`
+    (as `<name>.<cache tag>.config.pyc`) and reused while the source's
+    mtime and size and the python version are unchanged.
+    """
+    with open(filename, mode="rb") as config_file:
+        stat = os.fstat(config_file.fileno())
+        cache_path = _code_cache_path(filename)
+        code = _read_code_cache(cache_path, stat)
+        if code is None:
+            code = compile(config_file.read(), filename, "exec")
+            _write_code_cache(cache_path, stat, code)
+    return code
+
+
+def _equal(old, new):
+    """ Whether a reloaded value is the same as the old one (values that can't be compared count as changed). """
+    if old is new:
+        return True
+    try:
+        if isinstance(old, Lazy) and isinstance(new, Lazy):
+            # a re-run file makes new markers; keep the old (maybe computed) one if it would compute the same
+            return old.func == new.func and old.args == new.args and old.kwargs == new.kwargs
+        return bool(old == new)
+    except Exception:
+        return False
+
+
+class Lazy(object):
+    """ A config value computed on first use (see :func:`lazy`). """
+
+    def __init__(self, func, args=(), kwargs=None):
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs or {}
+        self._lock = threading.Lock()
+        self._resolved = False
+        self._value = None
+
+    def resolve(self):
+        """ Returns the value, computing it (once, even across threads) if needed. """
+        if not self._resolved:
+            with self._lock:
+                if not self._resolved:
+                    self._value = self.func(*self.args, **self.kwargs)
+                    self._resolved = True
+        return self._value
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        if self._resolved:
+            return "<lazy %r>" % (self._value,)
+        return "<lazy %s>" % getattr(self.func, "__qualname__", self.func)
+
+
+def lazy(func, *args, **kwargs):
+    """ Marks a config value to be computed by ``func(*args, **kwargs)`` the first time it is read.
+
+    Example (in a config file)::
+
+        TIMEZONE = lazy(pytz.timezone, 'America/Denver')
+        SIGNING_KEY = lazy(Path('/etc/app/signing.key').read_bytes)
+
+    ``config['TIMEZONE']``, ``config.get('TIMEZONE')``, :meth:`Config.get_namespace`
+    and :class:`ConfigAttribute` return the computed value; iterating over
+    ``items()`` or ``values()`` gives the markers themselves.
+    """
+    return Lazy(func, args, kwargs)
+
+
+def resolve(value):
+    """ Returns value, computed if it is a :func:`lazy` marker. """
+    return value.resolve() if isinstance(value, Lazy) else value
+
+
+_ATTRIBUTE_CACHE = "_config_attribute_cache"
+
+
 class ConfigAttribute(object):
     """ Makes an attribute forward to the config
 
+    When the config is a :class:`Config`, the (converted) value is memoized
+    on the instance until the config is next written to, so the converter
+    only runs again after a change.
+
     Copied from flask/config.py
     """
 
@@ -21,9 +176,20 @@ class ConfigAttribute(object):
     def __get__(self, obj, type=None):
         if obj is None:
             return self
-        rv = obj.config[self.__name__]
+        config = obj.config
+        version = getattr(config, "_version", None)
+        cache = getattr(obj, "__dict__", None) if version is not None else None
+        if cache is not None:
+            # converted values are kept on the instance, per attribute (others may convert
+            # the same key differently), until the config is written to
+            cached = cache.get(_ATTRIBUTE_CACHE, {}).get(self)
+            if cached is not None and cached[0] is config and cached[1] == version:
+                return cached[2]
+        rv = resolve(config[self.__name__])
         if self.get_converter is not None:
             rv = self.get_converter(rv)
+        if cache is not None:
+            cache.setdefault(_ATTRIBUTE_CACHE, {})[self] = (config, version, rv)
         return rv
 
     def __set__(self, obj, value):
@@ -72,6 +238,12 @@ class Config(dict):
         from.  By default, this will be `<run-time root directory>/config`
     :param defaults: an optional dictionary of default values
 
+    Files loaded with :meth:`from_pyfile` (or :meth:`from_env_stage`) are
+    remembered, so the config can follow changes to them while it runs::
+
+        config.on_change(lambda keys: print("changed:", sorted(keys)))
+        config.watch(interval=2.0)
+
     Copied, with a few modifications, from flask/config.py (see LICENSE.txt)
     """
     DEFAULT_CONFIG_DIR = "config"
@@ -116,12 +288,26 @@ class Config(dict):
             config directory or a file within it.
         """
         dict.__init__(self, defaults or {})
+        # bumped on every write, so cached views know when they are stale
+        self._version = 0
+        # (namespace, lowercase, trim_namespace) -> (version, read-only view)
+        self._namespaces = {}
+        # loaded file -> (mtime_ns, size) when it was loaded
+        self._sources = {}
+        # the values the loaded files gave, so a reload only applies what the files changed
+        self._source_values = {}
+        self._change_callbacks = []
+        self._reload_lock = threading.Lock()
+        self._watch_stop = None
+        self.last_reload_error = None
 
         if config_root is None:
             repo_root = find_repo_root(os.getcwd())
             config_root_path = str(repo_root.joinpath(self.DEFAULT_CONFIG_DIR))
-
-        config_root_path = config_root.__file__ if isinstance(config_root, ModuleType) else str(config_root)
+        elif isinstance(config_root, ModuleType):
+            config_root_path = config_root.__file__
+        else:
+            config_root_path = str(config_root)
 
         if os.path.isfile(config_root_path):
             config_root_dir = os.path.dirname(os.path.realpath(config_root_path))
@@ -129,6 +315,42 @@ class Config(dict):
             config_root_dir = config_root_path
         self.config_root_dir = config_root_dir
 
+    def snapshot(self, path):
+        """ Writes the uppercase values (with :func:`lazy` ones computed) to path.
+
+        Meant to be called once, e.g. in a pre-fork master, so workers can
+        load the config with :meth:`from_snapshot` instead of finding and
+        running the config files again.  The file is a pickle and is
+        replaced atomically.
+
+        :raises TypeError: naming every value that can't be pickled (nothing
+            is written).
+        """
+        values = {key: resolve(value) for key, value in dict.items(self) if key.isupper()}
+        payload = dict(config_root_dir=self.config_root_dir, values=values)
+        try:
+            data = pickle.dumps(payload, protocol=pickle.HIGHEST_PROTOCOL)
+        except Exception:
+            unpicklable = []
+            for key, value in values.items():
+                try:
+                    pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+                except Exception as exc:
+                    unpicklable.append("%s (%s)" % (key, exc))
+            raise TypeError("Unable to snapshot config values: %s" % ", ".join(unpicklable or ["config_root_dir"]))
+        _atomic_write(path, data)
+
+    @classmethod
+    def from_snapshot(cls, path):
+        """ Creates a config from a file written by :meth:`snapshot`.
+
+        Only load snapshots you wrote yourself: like any pickle, the file can
+        run arbitrary code when it is loaded.
+        """
+        with open(path, "rb") as snapshot_file:
+            payload = pickle.load(snapshot_file)
+        return cls(config_root=payload["config_root_dir"], defaults=payload["values"])
+
     def from_envvar(self, variable_name, silent=False):
         """Loads a configuration from an environment variable pointing to
         a configuration file.  This is basically just a shortcut with nicer
@@ -164,23 +386,175 @@ class Config(dict):
         :param silent: set to ``True`` if you want silent failure for missing
                        files.
 
+        The compiled file is cached (see :func:`compile_config_file`), so
+        later loads of an unchanged file skip compiling it.
+
         .. versionadded:: 0.7
            `silent` parameter.
         """
         filename = os.path.join(self.config_root_dir, filename)
-        dir_ = types.ModuleType("config")
-        dir_.__file__ = filename
         try:
-            with open(filename, mode="rb") as config_file:
-                exec(compile(config_file.read(), filename, "exec"), dir_.__dict__)
+            signature = self._source_signature(filename)
+            values = self._exec_pyfile(filename)
         except IOError as e:
             if silent and e.errno in (errno.ENOENT, errno.EISDIR, errno.ENOTDIR):
                 return False
             e.strerror = "Unable to load configuration file (%s)" % e.strerror
             raise
-        self.from_object(dir_)
+        self.update(values)
+        self._sources[filename] = signature
+        self._source_values.update(values)
         return True
 
+    @staticmethod
+    def _exec_pyfile(filename):
+        """ Runs the config file and returns its uppercase values. """
+        dir_ = types.ModuleType("config")
+        dir_.__file__ = filename
+        exec(compile_config_file(filename), dir_.__dict__)
+        return {key: getattr(dir_, key) for key in dir(dir_) if key.isupper()}
+
+    @staticmethod
+    def _source_signature(filename):
+        stat = os.stat(filename)
+        return stat.st_mtime_ns, stat.st_size
+
+    def __getstate__(self):
+        # the lock and the watch thread belong to this process
+        state = dict(self.__dict__, _watch_stop=None, _namespaces={})
+        del state['_reload_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._reload_lock = threading.Lock()
+
+    def __getitem__(self, key):
+        return resolve(dict.__getitem__(self, key))
+
+    def get(self, key, default=None):
+        return resolve(dict.get(self, key, default))
+
+    def _changed(self):
+        # unpickling sets items before __setstate__, hence the getattr
+        self._version = getattr(self, '_version', 0) + 1
+
+    def __setitem__(self, key, value):
+        dict.__setitem__(self, key, value)
+        self._changed()
+
+    def __delitem__(self, key):
+        dict.__delitem__(self, key)
+        self._changed()
+
+    def update(self, *args, **kwargs):
+        dict.update(self, *args, **kwargs)
+        self._changed()
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return self[key]
+
+    def pop(self, key, *default):
+        value = dict.pop(self, key, *default)
+        self._changed()
+        return value
+
+    def popitem(self):
+        item = dict.popitem(self)
+        self._changed()
+        return item
+
+    def clear(self):
+        dict.clear(self)
+        self._changed()
+
+    def __ior__(self, other):
+        self.update(other)
+        return self
+
+    def on_change(self, callback):
+        """ Registers callback to be called with the set of keys that changed on a reload.
+
+        Returns the callback, so this can be used as a decorator.
+        """
+        self._change_callbacks.append(callback)
+        return callback
+
+    def reload_if_changed(self):
+        """ Reloads the files loaded with :meth:`from_pyfile` if any of them changed.
+
+        The files are re-run into a separate dict first; if that fails the
+        config is left as it was.  The new values are compared with what the
+        files gave last time (not with the config itself), so values set
+        since, with ``config[key] = ...``, :meth:`from_object` or
+        :meth:`from_mapping`, are only replaced if the files changed them.
+        New and changed values are applied with a single ``update``, so
+        readers see either all of them or none of them, without any locking.
+        Keys the files no longer define are removed after that (unless they
+        were set some other way since), so a reader may briefly see the new
+        values alongside them.  Then the change callbacks are called.
+
+        :return: the set of keys that changed (empty if nothing did).
+        """
+        with self._reload_lock:
+            signatures = {}
+            for filename in self._sources:
+                try:
+                    signatures[filename] = self._source_signature(filename)
+                except OSError:
+                    signatures[filename] = None
+            if signatures == self._sources:
+                return set()
+
+            values = {}
+            for filename in self._sources:
+                values.update(self._exec_pyfile(filename))
+
+            missing = object()
+            previous = self._source_values
+            changed = {key: value for key, value in values.items() if not _equal(previous.get(key, missing), value)}
+            removed = {
+                key for key in previous.keys() - values.keys()
+                if _equal(dict.get(self, key, missing), previous[key])
+            }
+            self.update(changed)
+            for key in removed:
+                self.pop(key, None)
+            self._sources = signatures
+            self._source_values = values
+
+        changed_keys = set(changed) | removed
+        if changed_keys:
+            for callback in self._change_callbacks:
+                callback(changed_keys)
+        return changed_keys
+
+    def watch(self, interval=1.0):
+        """ Starts a background thread calling :meth:`reload_if_changed` every interval seconds.
+
+        Errors from a reload are kept in ``last_reload_error`` (and the
+        config is left as it was) rather than stopping the thread.
+        """
+        self.stop_watching()
+        self._watch_stop = stop = threading.Event()
+
+        def run():
+            while not stop.wait(interval):
+                try:
+                    self.reload_if_changed()
+                except Exception as exc:
+                    self.last_reload_error = exc
+
+        threading.Thread(target=run, name="config-watch", daemon=True).start()
+        return self
+
+    def stop_watching(self):
+        if self._watch_stop is not None:
+            self._watch_stop.set()
+            self._watch_stop = None
+
     def from_object(self, obj):
         """Updates the values from the given object.  An object can be of one
         of the following two types:
@@ -243,7 +617,7 @@ class Config(dict):
         return True
 
     def get_namespace(self, namespace, lowercase=True, trim_namespace=True):
-        """Returns a dictionary containing a subset of configuration options
+        """Returns a read-only mapping containing a subset of configuration options
         that match the specified namespace/prefix. Example usage::
 
             app.config['IMAGE_STORE_TYPE'] = 'fs'
@@ -262,6 +636,9 @@ class Config(dict):
         This is often useful when configuration options map directly to
         keyword arguments in functions or class constructors.
 
+        Namespaces are cached until the config is next written to, so
+        repeated calls with the same arguments are cheap.
+
         :param namespace: a configuration namespace
         :param lowercase: a flag indicating if the keys of the resulting
                           dictionary should be lowercase
@@ -270,6 +647,12 @@ class Config(dict):
 
         .. versionadded:: 0.11
         """
+        cache_key = (namespace, lowercase, trim_namespace)
+        version = self._version
+        cached = self._namespaces.get(cache_key)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+
         rv = {}
         for k, v in self.items():
             if not k.startswith(namespace):
@@ -280,8 +663,139 @@ class Config(dict):
                 key = k
             if lowercase:
                 key = key.lower()
-            rv[key] = v
-        return rv
+            rv[key] = resolve(v)
+        view = MappingProxyType(rv)
+        self._namespaces[cache_key] = (version, view)
+        return view
 
     def __repr__(self):
         return "<%s %s>" % (self.__class__.__name__, dict.__repr__(self))
+
+
+class LayeredConfig(ChainMap):
+    """ Config layers looked up in place rather than merged into one dict.
+
+    The layers, from highest to lowest precedence, are:
+
+    -   ``env``: environment variables overriding keys of the layers below
+        (named ``env_prefix + key``; the values are strings)
+    -   ``stage``: the config file for the stage (``<stage>.py``)
+    -   ``default``: ``default.py``, if there is one
+
+    Each file is loaded once into its own :class:`Config`, and a layer can
+    be reloaded without touching the others.  Resolved lookups are cached
+    per key until a layer changes or a value is set.  Values set directly
+    go into the ``env`` layer.  Changes made to a layer itself (through
+    :meth:`layer`, or by a :meth:`Config.watch` on it) are picked up too,
+    since the cache is checked against each layer's write version.
+
+    Example::
+
+        config = LayeredConfig('/path/to/config', stage='production')
+        config['DB_HOST']            # from the env, production.py or default.py
+        config.reload_layer('stage')
+        config.flatten()             # a plain Config of the merged values
+    """
+    DEFAULT_FILE = "default.py"
+    LAYERS = ("env", "stage", "default")
+
+    def __init__(self, config_root=None, stage=None, env=None, env_prefix=""):
+        """
+        Args:
+          config_root (str or Path or module): As for :class:`Config`.
+          stage (str): The stage file to load.  Defaults to $ENV_STAGE.
+          env (Mapping): Where the env layer is read from.  Defaults to
+            os.environ.
+          env_prefix (str): Prefix of the variables in the env layer.
+        """
+        self.config_root_dir = Config(config_root=config_root).config_root_dir
+        self.stage = stage or os.environ.get(Config.STAGE_VAR)
+        self.env = os.environ if env is None else env
+        self.env_prefix = env_prefix
+        self._cache = {}
+        self._cache_versions = None
+        self._flat = None
+        stage_layer = self._load_stage()
+        default = self._load_default()
+        super().__init__(self._load_env(stage_layer, default), stage_layer, default)
+
+    def _load_stage(self):
+        layer = Config(config_root=self.config_root_dir)
+        if self.stage:
+            layer.from_pyfile(f"{self.stage}.py")
+        return layer
+
+    def _load_default(self):
+        layer = Config(config_root=self.config_root_dir)
+        layer.from_pyfile(self.DEFAULT_FILE, silent=True)
+        return layer
+
+    def _load_env(self, *file_layers):
+        layer = Config(config_root=self.config_root_dir)
+        keys = set().union(*file_layers)
+        layer.from_mapping(
+            [(key, self.env[self.env_prefix + key]) for key in keys if self.env_prefix + key in self.env]
+        )
+        return layer
+
+    def layer(self, name):
+        """ Returns the :class:`Config` holding the named layer (one of LAYERS). """
+        return self.maps[self.LAYERS.index(name)]
+
+    def reload_layer(self, name):
+        """ Reloads just the named layer (one of LAYERS).
+
+        Reloading a file layer also re-reads the env layer, since which
+        variables it holds depends on the keys the files define.
+        """
+        if name == "stage":
+            self.maps[1] = self._load_stage()
+        elif name == "default":
+            self.maps[2] = self._load_default()
+        elif name != "env":
+            raise ValueError(f"Unknown layer {name!r}; expected one of {self.LAYERS}")
+        self.maps[0] = self._load_env(*self.maps[1:])
+        self._invalidate()
+
+    def _invalidate(self):
+        self._cache = {}
+        self._flat = None
+
+    def _check_cache(self):
+        """ Drops the cached lookups if any layer was replaced or written to since they were made. """
+        versions = tuple((id(layer), layer._version) for layer in self.maps)
+        if versions != self._cache_versions:
+            self._invalidate()
+            self._cache_versions = versions
+
+    def __getitem__(self, key):
+        self._check_cache()
+        try:
+            return self._cache[key]
+        except KeyError:
+            pass
+        value = super().__getitem__(key)
+        self._cache[key] = value
+        return value
+
+    def get(self, key, default=None):
+        return self[key] if key in self else default
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self._invalidate()
+
+    def __delitem__(self, key):
+        super().__delitem__(key)
+        self._invalidate()
+
+    def flatten(self):
+        """ Returns a new :class:`Config` holding the merged (and resolved) values. """
+        return Config(config_root=self.config_root_dir, defaults={key: self[key] for key in self})
+
+    def get_namespace(self, namespace, lowercase=True, trim_namespace=True):
+        """ See :meth:`Config.get_namespace`. """
+        self._check_cache()
+        if self._flat is None:
+            self._flat = self.flatten()
+        return self._flat.get_namespace(namespace, lowercase=lowercase, trim_namespace=trim_namespace)
@@ -6,11 +6,45 @@ any settings from the config file that matches the ENV_STAGE setting.
 """
 import configparser
 import os
+from collections.abc import Mapping
 from pathlib import Path
+from types import MappingProxyType
+
+try:
+    import tomllib as toml_parser  # python 3.11+
+except ImportError:
+    try:
+        import tomli as toml_parser
+    except ImportError:
+        try:
+            import toml as toml_parser
+        except ImportError:
+            toml_parser = None
 
 ENV_STAGE_VAR = "ENV_STAGE"
 PYPROJECT_FILENAME = "pyproject.toml"
 
+# real path of a starting directory -> (repo root, [(directory, mtime_ns)] from there up to the root)
+_repo_roots = {}
+# real path of a config directory -> (stages, mtime_ns of the directory)
+_allowed_stages = {}
+# real path of a pyproject.toml -> ((mtime_ns, size), parsed config)
+_pyprojects = {}
+
+
+def clear_discovery_cache():
+    """ Forgets every repo root, stage list and parsed pyproject.toml found so far. """
+    _repo_roots.clear()
+    _allowed_stages.clear()
+    _pyprojects.clear()
+
+
+def _mtime_ns(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
 
 def setup_config(config, current_file_path, relative_config_path="config"):
     """ Sets up a flask-like config object with config-file variables.
@@ -57,15 +91,83 @@ def find_repo_root(filename):
 
     Returns:
       (Path): A pathlib.Path object.
+
+    Results are cached per directory and reused while the mtimes of the
+    directories from there up to the repo root are unchanged (which they
+    won't be if an __init__.py is added to or removed from any of them).
+    Use clear_discovery_cache() after restructuring packages.
     """
     path = os.path.realpath(filename)
     dir_path = path if os.path.isdir(str(path)) else os.path.dirname(path)
+    cached = _repo_roots.get(dir_path)
+    if cached is not None and all(_mtime_ns(walked) == mtime for walked, mtime in cached[1]):
+        return cached[0]
+
     path = Path(dir_path)
-    return next((parent for parent in [path, *path.parents] if not parent.joinpath("__init__.py").exists()))
+    walked = []
+    for parent in [path, *path.parents]:
+        walked.append((parent, _mtime_ns(parent)))
+        if not parent.joinpath("__init__.py").exists():
+            break
+    root = walked[-1][0]
+    _repo_roots[dir_path] = (root, walked)
+    return root
+
+
+class TomlConfig(Mapping):
+    """ Read-only access to a parsed TOML document.
+
+    Tables can be reached by their dotted name as well as by nesting, so
+    `config["tool.poetry"]["name"]` works just as it did with the
+    ConfigParser this replaces.
+    """
+
+    def __init__(self, data):
+        self._data = data
+
+    def __getitem__(self, key):
+        if key in self._data:
+            value = self._data[key]
+        else:
+            value = self._data
+            for part in key.split("."):
+                if not isinstance(value, dict) or part not in value:
+                    raise KeyError(key)
+                value = value[part]
+        return TomlConfig(value) if isinstance(value, dict) else value
+
+    def __iter__(self):
+        return iter(self._data)
+
+    def __len__(self):
+        return len(self._data)
+
+    def to_dict(self):
+        """ A read-only view of the parsed document. """
+        return MappingProxyType(self._data)
+
+    def __repr__(self):
+        return f"<{self.__class__.__name__} {self._data!r}>"
+
+
+def _parse_pyproject(path):
+    """ Parses with whichever TOML library is installed, else falls back to ConfigParser. """
+    if toml_parser is None:
+        config = configparser.ConfigParser()
+        config.read(path)
+        return config
+    with open(path, encoding="utf-8") as toml_file:
+        return TomlConfig(toml_parser.loads(toml_file.read()))
 
 
 def get_pyproject_config(some_path=None, filename_=PYPROJECT_FILENAME):
-    """ Returns a ConfigParser instance for the pyproject.toml.
+    """ Returns the parsed pyproject.toml.
+
+    The file is parsed with tomllib (or tomli or toml, whichever is
+    installed) into a TomlConfig.  Without any of them, a ConfigParser is
+    returned (which does not understand TOML values, e.g. strings keep
+    their quotes).  Parsed files are cached while their mtime and size are
+    unchanged, so treat the result as read-only.
 
     Args:
       some_path (str): A path inside the package of interest.  If none
@@ -74,12 +176,21 @@ def get_pyproject_config(some_path=None, filename_=PYPROJECT_FILENAME):
         you are at during execution.)
       filename (str): The name of the configuration file.
     """
-    config = configparser.ConfigParser()
-
     some_path = some_path or os.getcwd()
     repo_root_path = find_repo_root(some_path)
-    pyproject_config = repo_root_path.joinpath(filename_)
-    config.read(str(pyproject_config))
+    pyproject_path = os.path.realpath(repo_root_path.joinpath(filename_))
+    try:
+        stat = os.stat(pyproject_path)
+    except OSError:
+        # as with ConfigParser.read, a missing file gives an empty config
+        return _parse_pyproject(pyproject_path) if toml_parser is None else TomlConfig({})
+
+    signature = (stat.st_mtime_ns, stat.st_size)
+    cached = _pyprojects.get(pyproject_path)
+    if cached is not None and cached[0] == signature:
+        return cached[1]
+    config = _parse_pyproject(pyproject_path)
+    _pyprojects[pyproject_path] = (signature, config)
     return config
 
 
@@ -93,6 +204,7 @@ def get_project_name(some_path=None):
         during execution, which is the default)
     """
     config = get_pyproject_config(some_path)
+    # only the ConfigParser fallback leaves the quotes on
     return config["tool.poetry"]["name"].strip('"\'')
 
 
@@ -105,7 +217,16 @@ class ConfigFinder:
         self.config_path = config_path
 
     def get_allowed_stages(self):
-        return [path.stem for path in self.config_path.glob("*.py") if not str(path.stem).startswith("_")]
+        """ The stages with a config file, cached while the directory's mtime is unchanged. """
+        key = os.path.realpath(self.config_path)
+        mtime_ns = _mtime_ns(key)
+        cached = _allowed_stages.get(key)
+        if cached is not None and cached[1] == mtime_ns:
+            return list(cached[0])
+
+        stages = [path.stem for path in Path(key).glob("*.py") if not str(path.stem).startswith("_")]
+        _allowed_stages[key] = (stages, mtime_ns)
+        return list(stages)
 
     def get_stage(self):
         ENV_STAGE = os.environ.get(ENV_STAGE_VAR)
@@ -1,32 +1,174 @@
+import json
+import os
+from bisect import bisect_right
 from collections import defaultdict
+from collections import deque
+from collections.abc import Sequence
+from concurrent.futures import ProcessPoolExecutor
 from itertools import chain
 from itertools import combinations
 from itertools import islice
 from itertools import tee
 
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
-def group_by(func, values):
+
+PARALLEL_CHUNK_SIZE = 10000
+
+
+def _keys_for(func, chunk):
+    return [func(value) for value in chunk]
+
+
+def _parallel_keyed(func, values, workers, chunk_size):
+    """ Yields (func(value), value) in input order, with func run on a process pool. """
+    chunks = list(each_slice(chunk_size, values))
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as executor:
+        # map hands back results in submission order, whichever worker finishes first
+        for chunk, keys in zip(chunks, executor.map(_keys_for, [func] * len(chunks), chunks)):
+            yield from zip(keys, chunk)
+
+
+def group_by(func, values, parallel=False, workers=None, chunk_size=PARALLEL_CHUNK_SIZE):
     """ Groups values by func.
 
+    Args:
+      func: Returns the key of a value.
+      values (iterable): The values to group.
+      parallel (bool): Compute the keys on a process pool.  Only worth it
+        when func is expensive (see benchmarks/enumerable_group_by.py).  func
+        and the values must be picklable (so no lambdas).
+      workers (int): Number of processes (implies parallel).  Defaults to
+        the number of cpus.
+      chunk_size (int): Number of values sent to a process at a time.
+
     Returns
       (dict): Keys produced by func pointing to lists of the values grouped.
+      Groups are in order of first appearance and hold their values in
+      input order, whether or not parallel is used.
     """
     groups = defaultdict(list)
-    for value in values:
-        groups[func(value)].append(value)
+    if parallel or workers:
+        for key, value in _parallel_keyed(func, values, workers, chunk_size):
+            groups[key].append(value)
+    else:
+        for value in values:
+            groups[func(value)].append(value)
     return dict(groups)
 
 
-def index_by(func, values):
+def index_by(func, values, parallel=False, workers=None, chunk_size=PARALLEL_CHUNK_SIZE):
     """ Indexes values by func.
 
+    Args:
+      parallel, workers, chunk_size: As for group_by.
+
     Returns
-      (dict): Keys produced by func, each pointing to one value.
+      (dict): Keys produced by func, each pointing to one value (the last
+      one with that key).
     """
+    if parallel or workers:
+        return dict(_parallel_keyed(func, values, workers, chunk_size))
     return {func(value): value for value in values}
 
 
-def each_cons(size, iterable):
+def group_by_array(keys, values=None):
+    """ Groups positions (or values) by the key at the same position, for large key arrays.
+
+    With numpy, this is a stable argsort of the keys followed by finding
+    where the sorted keys change, so no python objects are made per row.
+
+    Args:
+      keys (sequence or numpy array): One (numeric or string) key per row.
+      values (sequence or numpy array): One value (or row) per key.  If
+        None, the indices of the keys are grouped instead.
+
+    Returns
+      (dict): Each distinct key, in sorted order, pointing to the values (or
+      indices) with that key in input order.  With numpy these are views
+      into a single sorted array; without numpy they are lists.
+
+    Example:
+      group_by_array(np.array([3, 1, 3, 2]), np.array([10, 11, 12, 13]))
+      # => {1: array([11]), 2: array([13]), 3: array([10, 12])}
+    """
+    if np is None:
+        groups = defaultdict(list)
+        for index, key in enumerate(keys):
+            groups[key].append(index if values is None else values[index])
+        return {key: groups[key] for key in sorted(groups)}
+
+    keys = np.asarray(keys)
+    if len(keys) == 0:
+        return {}
+    order = np.argsort(keys, kind="stable")
+    sorted_keys = keys[order]
+    boundaries = np.flatnonzero(sorted_keys[1:] != sorted_keys[:-1]) + 1
+    starts = np.concatenate(([0], boundaries))
+    ends = np.concatenate((boundaries, [len(keys)]))
+    grouped = order if values is None else np.asarray(values)[order]
+    return {key: grouped[start:end] for key, start, end in zip(sorted_keys[starts].tolist(), starts, ends)}
+
+
+class SequenceView(Sequence):
+    """ A read-only window onto part of a sequence, made without copying it.
+
+    The view reads through to the underlying sequence, so it reflects later
+    changes to it.
+    """
+    __slots__ = ("_sequence", "_start", "_stop")
+
+    def __init__(self, sequence, start=0, stop=None):
+        self._sequence = sequence
+        self._start = start
+        self._stop = len(sequence) if stop is None else stop
+
+    def __len__(self):
+        return self._stop - self._start
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step != 1:
+                return [self[i] for i in range(start, stop, step)]
+            return SequenceView(self._sequence, self._start + start, self._start + max(start, stop))
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("SequenceView index out of range")
+        return self._sequence[self._start + index]
+
+    def __iter__(self):
+        return map(self._sequence.__getitem__, range(self._start, self._stop))
+
+    def __eq__(self, other):
+        if not isinstance(other, Sequence) or isinstance(other, str):
+            return NotImplemented
+        return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({list(self)!r})"
+
+
+# windows at least this big are cheaper to keep in a deque than in tee'd iterators
+_RING_BUFFER_MIN_SIZE = 16
+
+
+def _as_view_source(iterable):
+    """ Returns (kind, sequence) for inputs that can be windowed without copying, else (None, None). """
+    if np is not None and isinstance(iterable, np.ndarray):
+        return "array", iterable
+    if isinstance(iterable, (bytes, bytearray, memoryview)):
+        return "buffer", memoryview(iterable)
+    if isinstance(iterable, Sequence) and not isinstance(iterable, str):
+        return "sequence", iterable
+    return None, None
+
+
+def each_cons(size, iterable, views=False):
     """ Moves a sliding window along the iterable and yields consecutive windows.
 
     Example:
@@ -34,18 +176,44 @@ def each_cons(size, iterable):
           print(chunk)
 
       # output:
-      [1, 2, 3]
-      [2, 3, 4]
-      [3, 4, 5]
+      (1, 2, 3)
+      (2, 3, 4)
+      (3, 4, 5)
+
+    Args:
+      views (bool): Yield windows that share memory with the input instead
+        of tuples: numpy arrays give array slices (windows of rows for 2-D
+        arrays), bytes-like objects give memoryview slices and other sequences give
+        SequenceViews.  Plain iterators still give tuples.
 
     Taken from: https://stackoverflow.com/a/54110047/422075
     """
+    if views:
+        kind, sequence = _as_view_source(iterable)
+        if kind in ("array", "buffer"):
+            # basic slices of arrays and memoryviews are views already
+            for start in range(len(sequence) - size + 1):
+                yield sequence[start:start + size]
+            return
+        if kind == "sequence":
+            for start in range(len(sequence) - size + 1):
+                yield SequenceView(sequence, start, start + size)
+            return
+
+    if size >= _RING_BUFFER_MIN_SIZE:
+        iterator = iter(iterable)
+        window = deque(islice(iterator, size - 1), maxlen=size)
+        for item in iterator:
+            window.append(item)
+            yield tuple(window)
+        return
+
     iterators = tee(iterable, size)
     iterators = [islice(iterator, i, None) for i, iterator in enumerate(iterators)]
     yield from zip(*iterators)
 
 
-def each_slice(size, iterable):
+def each_slice(size, iterable, views=False):
     """ Chunks the iterable into size elements at a time, each yielded as a list.
 
     Example:
@@ -56,7 +224,28 @@ def each_slice(size, iterable):
       [1, 2]
       [3, 4]
       [5]
+
+    Args:
+      views (bool): Yield chunks that share memory with the input instead of
+        lists (as for each_cons: array slices, memoryview slices or
+        SequenceViews).  Plain iterators still give lists.
     """
+    if views:
+        kind, sequence = _as_view_source(iterable)
+        if kind is not None:
+            for start in range(0, len(sequence), size):
+                if kind == "sequence":
+                    yield SequenceView(sequence, start, min(start + size, len(sequence)))
+                else:
+                    yield sequence[start:start + size]
+            return
+
+    if type(iterable) is list:
+        # slicing copies the pointers in one go rather than an append at a time
+        for start in range(0, len(iterable), size):
+            yield iterable[start:start + size]
+        return
+
     current_slice = []
     for item in iterable:
         current_slice.append(item)
@@ -67,19 +256,53 @@ def each_slice(size, iterable):
         yield current_slice
 
 
-def each_slice_or_size(iterable, max_len: int, max_bytes: float):
+def json_size(item):
+    """ The number of bytes item takes up encoded as JSON. """
+    return len(json.dumps(item).encode())
+
+
+def each_slice_or_size(iterable, max_len: int, max_bytes: float, size_func=json_size, emit_oversized=False):
+    """ Chunks the iterable into lists of at most max_len items and max_bytes total size.
+
+    The size of each item is measured once with size_func and kept in a
+    running total, so each item costs O(1) on top of size_func.
+
+    Example:
+      for chunk in each_slice_or_size(records, max_len=500, max_bytes=1000000):
+          upload(chunk)
+
+    Args:
+      max_len (int): The most items in a chunk.
+      max_bytes (number): The most total size of a chunk.
+      size_func: Returns the size of an item.  Defaults to the length of its
+        JSON encoding; use `len` for items that are already bytes.
+      emit_oversized (bool): Whether an item bigger than max_bytes on its
+        own is yielded in a chunk by itself.  Otherwise ValueError is raised.
+    """
     current_slice = []
+    current_bytes = 0
 
     for item in iterable:
-        if sys.getsizeof(current_slice) + sys.getsizeof(item) >= max_bytes:
+        item_bytes = size_func(item)
+        if item_bytes > max_bytes:
+            if not emit_oversized:
+                raise ValueError(f"An item of size {item_bytes} is bigger than max_bytes ({max_bytes})")
+            if current_slice:
+                yield current_slice
+                current_slice, current_bytes = [], 0
+            yield [item]
+            continue
+
+        if current_bytes + item_bytes > max_bytes:
             yield current_slice
-            current_slice = []
+            current_slice, current_bytes = [], 0
 
         current_slice.append(item)
+        current_bytes += item_bytes
 
         if len(current_slice) >= max_len:
             yield current_slice
-            current_slice = []
+            current_slice, current_bytes = [], 0
 
     if current_slice:
         yield current_slice
@@ -95,7 +318,8 @@ def all_combinations(iterable, min_size=1, max_size=None):
             len(list(iterable)).
 
     Returns:
-        (iterator): An iterator returning all requested combinations.
+        (iterator): An iterator returning all requested combinations.  For
+        len(), random access or splitting the work up, use CombinationSpace.
 
     Example:
         iterator = all_combinations([1, 2, 3])
@@ -103,12 +327,155 @@ def all_combinations(iterable, min_size=1, max_size=None):
         # output of list(iterator):
         [(1,), (2,), (3,), (1, 2), (1, 3), (2, 3), (1, 2, 3)]
     """
-    min_size = max(min_size, 0)
-    as_list = list(iterable)
-    size = len(as_list)
-    max_size = size if max_size is None else max_size
-    max_size = min(size, max_size)
-    return chain.from_iterable(combinations(as_list, size) for size in range(min_size, max_size + 1))
+    return iter(CombinationSpace(iterable, min_size=min_size, max_size=max_size))
+
+
+def _n_choose_k(n, k):
+    """ The number of ways to choose k of n things. """
+    if k < 0 or k > n:
+        return 0
+    k = min(k, n - k)
+    result = 1
+    for i in range(1, k + 1):
+        result = result * (n - k + i) // i
+    return result
+
+
+class CombinationSpace(Sequence):
+    """ Every combination from all_combinations, as a sequence.
+
+    The combinations are in the same order as all_combinations (by size,
+    then in itertools.combinations order), but len() is O(1) and any one of
+    them can be computed from its index (by unranking in the combinatorial
+    number system) without generating the ones before it.
+
+    Example:
+        space = CombinationSpace(range(30), min_size=2, max_size=4)
+        len(space)   # => 31900
+        space[1000]  # => (1, 8, 21)
+
+        # each worker iterates its own contiguous part of the space
+        with ProcessPoolExecutor() as executor:
+            results = executor.map(search, space.partition(8))
+    """
+
+    def __init__(self, iterable, min_size=1, max_size=None):
+        self.items = tuple(iterable)
+        size = len(self.items)
+        self.min_size = max(min_size, 0)
+        self.max_size = size if max_size is None else min(size, max_size)
+        # offsets[i] is the index of the first combination of size min_size + i
+        self._offsets = [0]
+        for combination_size in range(self.min_size, self.max_size + 1):
+            self._offsets.append(self._offsets[-1] + _n_choose_k(size, combination_size))
+
+    def __len__(self):
+        return self._offsets[-1]
+
+    def __iter__(self):
+        return chain.from_iterable(
+            combinations(self.items, size) for size in range(self.min_size, self.max_size + 1)
+        )
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step != 1:
+                return [self[i] for i in range(start, stop, step)]
+            return CombinationRange(self, start, max(start, stop))
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("CombinationSpace index out of range")
+        return tuple(self.items[i] for i in self._unrank(index))
+
+    def _unrank(self, index):
+        """ Returns the item indices of the combination at index. """
+        bucket = bisect_right(self._offsets, index) - 1
+        size = self.min_size + bucket
+        rank = index - self._offsets[bucket]
+        num_items = len(self.items)
+        indices = []
+        candidate = 0
+        for position in range(size):
+            while True:
+                # the number of combinations that start with candidate here
+                count = _n_choose_k(num_items - candidate - 1, size - position - 1)
+                if rank < count:
+                    break
+                rank -= count
+                candidate += 1
+            indices.append(candidate)
+            candidate += 1
+        return indices
+
+    def _iter_range(self, start, stop):
+        """ Yields the combinations from start up to stop, stepping from one to the next. """
+        if start >= stop:
+            return
+        num_items = len(self.items)
+        indices = self._unrank(start)
+        for _ in range(stop - start):
+            yield tuple(self.items[i] for i in indices)
+            size = len(indices)
+            # find the rightmost index that can still move right
+            position = size - 1
+            while position >= 0 and indices[position] == num_items - size + position:
+                position -= 1
+            if position < 0:
+                indices = list(range(size + 1))
+            else:
+                indices[position] += 1
+                for following in range(position + 1, size):
+                    indices[following] = indices[following - 1] + 1
+
+    def partition(self, num_parts):
+        """ Splits the space into num_parts contiguous CombinationRanges of (nearly) equal length. """
+        if num_parts < 1:
+            raise ValueError(f"num_parts must be at least 1, got {num_parts}")
+        base, extra = divmod(len(self), num_parts)
+        parts = []
+        start = 0
+        for part in range(num_parts):
+            stop = start + base + (1 if part < extra else 0)
+            parts.append(CombinationRange(self, start, stop))
+            start = stop
+        return parts
+
+    def __repr__(self):
+        return (
+            f"{self.__class__.__name__}({list(self.items)!r}, min_size={self.min_size}, max_size={self.max_size})"
+        )
+
+
+class CombinationRange(Sequence):
+    """ A contiguous part of a CombinationSpace (see CombinationSpace.partition). """
+
+    def __init__(self, space, start, stop):
+        self.space = space
+        self.start = start
+        self.stop = stop
+
+    def __len__(self):
+        return self.stop - self.start
+
+    def __iter__(self):
+        return self.space._iter_range(self.start, self.stop)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step != 1:
+                return [self[i] for i in range(start, stop, step)]
+            return CombinationRange(self.space, self.start + start, self.start + max(start, stop))
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("CombinationRange index out of range")
+        return self.space[self.start + index]
+
+    def __repr__(self):
+        return f"<{self.__class__.__name__} [{self.start}:{self.stop}] of {self.space!r}>"
 
 
 def compact(iterable, generator=False):
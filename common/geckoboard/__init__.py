@@ -0,0 +1,550 @@
+
+import hashlib
+import json
+import os
+from dataclasses import dataclass
+from datetime import date
+from datetime import datetime
+from typing import Any
+from typing import Dict
+
+import requests
+
+from common.enumerable import each_slice
+from common.geckoboard.catalog import SchemaCatalog
+from common.geckoboard.columns import columns_to_rows
+from common.geckoboard.columns import is_columnar
+from common.geckoboard.encoding import compress_payload
+from common.geckoboard.encoding import encode_payload
+from common.geckoboard.encoding import UploadBody
+from common.geckoboard.scheduler import RequestScheduler
+from common.geckoboard.validation import get_validator
+from common.picklers import Pickler
+
+
+class ResponseError(Exception):
+    def __init__(self, *args, response, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.response = response
+
+
+class Types:
+    DATETIME = 'datetime'
+    DATE = 'date'
+    NUMBER = 'number'
+    PERCENTAGE = 'percentage'
+    MONEY = 'money'
+    STRING = 'string'
+
+
+@dataclass
+class Field:
+    """ A field specification. """
+    type: str = Types.NUMBER
+    name: str = None
+    required: bool = False
+    unique: bool = False
+
+
+class Dataset:
+    """ Simple object to ease interaction with geckoboard.
+
+    The main python geckoboard client
+    (https://github.com/geckoboard/geckoboard-python) requires the template to
+    even *retrieve* a dataset, which is ridiculous.  So, this is a rewrite
+    that does not require a template before executing actions on the dataset.
+
+    Example usage:
+        from common.geckoboard import Dataset, Field, Types
+        # Examples below assume you've set GECKOBOARD_API_KEY
+        # Could also pass in api key directly: Dataset('some.id', api_key='abc14cdga1415ga1aagt1')
+
+        # dataset *data* operations
+        dataset = Dataset('some.id')
+        dataset.overwrite([dict(tpl='13', timestamp=datetime, num_orders=54)])
+        dataset.append([dict(tpl='14', timestamp=datetime, num_orders=22)])
+        dataset.sync([dict(tpl='13', timestamp=datetime, num_orders=55)])  # only sends changed rows
+        dataset.clear()
+
+        # data can also be given as columns (lists or numpy arrays)
+        dataset.append(dict(tpl=['13', '14'], timestamp=datetime64_array, num_orders=float_array))
+
+        # individual dataset *schema* operations
+        dataset = Dataset('some.id')
+
+        class MySchema:
+            tpl = Field(Types.STRING, required=True, unique=True),
+            timestamp = Field(Types.DATETIME, required=True),
+            num_orders = Field(Types.NUMBER),
+
+        dataset.create_schema(MySchema)
+        dataset.ensure_schema(MySchema)  # only creates it if it is not already in place
+        schema = dataset.get_schema()
+
+        # after create_schema (or with Dataset('some.id', schema=MySchema)),
+        # rows are checked locally and a ValidationError is raised before
+        # anything is sent if any are bad
+        dataset.validate(rows)
+        dataset.delete()
+
+        # get all the schemas
+        lots_of_schemas = Dataset.get_schemas()
+
+    Schemas are cached per api key for SCHEMA_TTL seconds (see
+    SchemaCatalog), so `get_schema` only lists the account's datasets when
+    the cache is stale.  `create_schema` and `delete` keep the cache current.
+    """
+    KEY_NAME = "GECKOBOARD_API_KEY"
+    BASE_URL = "https://api.geckoboard.com"
+    DATASETS_ENDPOINT = BASE_URL + "/datasets"
+    DATASETS_ENDPOINT_FORMAT_STR = BASE_URL + "/datasets/{}"
+    DATA_ENDPOINT_FORMAT_STR = f"{DATASETS_ENDPOINT}/{{}}/data"
+    # geckoboard allows at most 500 records per append request
+    MAX_APPEND_RECORDS = 500
+    # seconds to wait for a connection and then for each read of the response
+    TIMEOUT = (10, 60)
+    SNAPSHOT_DIR = os.path.join(os.path.expanduser("~"), ".cache", "geckoboard")
+    SCHEMA_TTL = SchemaCatalog.TTL
+
+    # (datasets endpoint, api key, dataset id) to the fingerprint of the schema known to be in place
+    _schema_fingerprints = {}
+    # every directory sync has kept snapshots in, so they can be dropped when the data changes
+    _snapshot_dirs = {SNAPSHOT_DIR}
+
+    @classmethod
+    def get_schemas(
+        cls, filter_on_ids: list = None, only_return_ids: bool = False, api_key: str = None, use_cache: bool = False
+    ):
+        """ Return all the datasets/schemas.
+
+        Args:
+            filter_on_ids: a list of ids to filter on.
+            only_return_ids: whether to only return a list of ids.
+            api_key: the api key (can be None if have set env var)
+            use_cache: whether a cached listing (no older than SCHEMA_TTL) may
+                be returned instead of fetching a new one.
+        """
+        catalog = cls._get_catalog(api_key)
+        schemas = catalog.schemas(refresh=not use_cache)
+
+        if only_return_ids:
+            return [scheme['id'] for scheme in schemas]
+
+        if filter_on_ids:
+            ids = set(filter_on_ids)
+            schemas = [scheme for scheme in schemas if scheme['id'] in ids]
+
+        return schemas
+
+    @classmethod
+    def _fetch_schemas(cls, api_key: str = None):
+        auth_params = cls._get_auth_params(api_key)
+        response = cls._request('get', cls.DATASETS_ENDPOINT, **auth_params)
+        return response.json()['data']
+
+    @classmethod
+    def _get_catalog(cls, api_key: str = None):
+        api_key = cls._get_api_key(api_key)
+        return SchemaCatalog.for_api_key(
+            api_key, fetch=lambda: cls._fetch_schemas(api_key), ttl=cls.SCHEMA_TTL, endpoint=cls.DATASETS_ENDPOINT
+        )
+
+    @classmethod
+    def get_schema_ids(cls, api_key: str = None):
+        """ Only return the ids of datasets. """
+        return cls.get_schemas(only_return_ids=True, api_key=api_key)
+
+    @staticmethod
+    def _get_api_key(api_key: str = None):
+        if not api_key:
+            api_key = os.environ[Dataset.KEY_NAME]
+        return api_key
+
+    @staticmethod
+    def _get_auth_params(api_key: str = None):
+        api_key = Dataset._get_api_key(api_key)
+        return dict(auth=(api_key, ''))
+
+    def _key_from_auth_params(self):
+        return self.auth_params['auth'][0]
+
+    @property
+    def scheduler(self):
+        """ The RequestScheduler shared by every dataset using this api key. """
+        return RequestScheduler.for_api_key(self._key_from_auth_params())
+
+    @classmethod
+    def _request(cls, method, url, max_retries: int = None, **kwargs):
+        """ Sends the request through the api key's scheduler and ensures the response is ok.
+
+        A file passed as `data` is rewound before every attempt so it can be resent.
+        max_retries overrides the scheduler's for this request, and requests
+        time out after TIMEOUT unless another `timeout` is given.
+        """
+        scheduler = RequestScheduler.for_api_key(kwargs['auth'][0])
+        kwargs.setdefault('timeout', cls.TIMEOUT)
+        body = kwargs.get('data')
+        if hasattr(body, 'seek'):
+            body = kwargs['data'] = UploadBody(body)
+
+        def send():
+            if hasattr(body, 'seek'):
+                body.seek(0)
+            return requests.request(method, url, **kwargs)
+
+        response = scheduler.call(send, max_retries=max_retries)
+        cls._ensure_response_ok(response)
+        return response
+
+    def __init__(
+        self, dataset_id: str, api_key: str = None, compress: bool = False, schema: Any = None, spool: Any = None
+    ):
+        """
+        Args:
+            dataset_id: The id of the geckoboard dataset.
+            api_key: The api key (can be None if have set env var).
+            compress: Whether to gzip the body of data uploads.
+            schema: The dataset's schema (see create_schema), if rows should
+                be validated before they are uploaded.
+            spool (DeadLetterSpool): If set, uploads that fail because
+                geckoboard is unavailable (connection errors, timeouts, 429s
+                and 5xxs) are written here straight away, without retrying,
+                instead of raising (see common.geckoboard.spool).  While
+                uploads for the dataset are waiting in the spool, new ones
+                are spooled behind them, so they are applied in order.
+        """
+        self.auth_params = self._get_auth_params(api_key)
+        self.dataset_id = dataset_id
+        self.compress = compress
+        self.validator = None if schema is None else get_validator(self._schema_fields(schema))
+        self.spool = spool
+        self.spooled_count = 0
+
+    def _field_to_field_def(self, key: str, field: Field) -> Dict[str, dict]:
+        """ Convert a Field into proper schema. """
+        return {
+            key: dict(
+                # could uppercase and put spaces for underscores or something here
+                name=field.name or key,
+                type=field.type,
+                required=field.required
+            )
+        }
+
+    def create_schema(self, schema: Any = None):
+        """ Creates the template
+
+        Args
+            schema: An instance or class that has Field instances as
+                attributes.  Or can be a dict-like object that has keys (the field
+                names) and values that are Field instances.
+
+        Returns:
+            None if successful.
+
+        Raises:
+            ResponseError if any problems.
+
+        Example:
+            class MySchema:
+                first = Field(Types.STRING)
+                second = Field()  # numeric by default
+                timestamp = Field(Types.DATETIME, required=True, unique=True)
+
+            dataset.create_schema(MySchema)
+
+            # could also be a dictionary
+            my_schema = dict(
+                first=Field(Types.STRING),
+                second=Field()  # numeric by default
+                timestamp=Field(Types.DATETIME, required=True, unique=True)
+            )
+        """
+        fields = self._schema_fields(schema)
+        self._put_template(self._template(fields))
+        self.validator = get_validator(fields)
+
+    def ensure_schema(self, schema: Any = None):
+        """ Creates the schema only if the dataset does not already have it.
+
+        The schema's fields and unique_by are reduced to a fingerprint, which
+        is compared to the one last put in place by this process and then to
+        the dataset's schema in the (cached) catalog.  Only if neither matches
+        is the schema created.
+
+        Args:
+            schema: As for create_schema.
+
+        Returns:
+            (bool): True if the schema was created, False if it was already in place.
+        """
+        fields = self._schema_fields(schema)
+        template = self._template(fields)
+        fingerprint = self._schema_fingerprint(template)
+        self.validator = get_validator(fields)
+
+        if self._schema_fingerprints.get(self._fingerprint_key()) == fingerprint:
+            return False
+
+        existing = self.get_schema()
+        if existing is not None and self._schema_fingerprint(existing) == fingerprint:
+            self._schema_fingerprints[self._fingerprint_key()] = fingerprint
+            return False
+
+        self._put_template(template)
+        return True
+
+    def _put_template(self, template):
+        response = self._request(
+            'put', self.DATASETS_ENDPOINT_FORMAT_STR.format(self.dataset_id), json=template, **self.auth_params
+        )
+        self._store_schema(response)
+        self._schema_fingerprints[self._fingerprint_key()] = self._schema_fingerprint(template)
+
+    def _template(self, fields: Dict[str, Field]) -> dict:
+        all_fields = {}
+        for name, field in fields.items():
+            all_fields.update(self._field_to_field_def(name, field))
+
+        unique_by = [name for name, field in fields.items() if field.unique]
+        return dict(
+            fields=all_fields,
+            unique_by=unique_by,
+        )
+
+    def _fingerprint_key(self):
+        return self.DATASETS_ENDPOINT, self._key_from_auth_params(), self.dataset_id
+
+    @staticmethod
+    def _schema_fingerprint(schema: dict) -> str:
+        """ A digest of the field names, types and unique_by of a template or of a fetched schema.
+
+        Whether a field is required is left out, since geckoboard does not
+        return it.
+        """
+        canonical = dict(
+            fields={key: [field.get('name', key), field['type']] for key, field in schema['fields'].items()},
+            unique_by=sorted(schema.get('unique_by') or []),
+        )
+        as_json = json.dumps(canonical, sort_keys=True)
+        return hashlib.blake2b(as_json.encode(), digest_size=16).hexdigest()
+
+    @staticmethod
+    def _schema_fields(schema: Any) -> Dict[str, Field]:
+        """ Returns the Field attributes (or values, for a dict) of schema by name. """
+        items = schema.items() if isinstance(schema, dict) else (
+            (att, getattr(schema, att)) for att in dir(schema) if not att.startswith("_")
+        )
+        return {name: value for name, value in items if not name.startswith("_") and isinstance(value, Field)}
+
+    def validate(self, data):
+        """ Checks and coerces data against the schema without sending anything.
+
+        Returns:
+            (list): The coerced rows.
+
+        Raises:
+            ValidationError with the RowError of every bad row (see
+            common.geckoboard.validation).
+        """
+        rows = self._as_rows(data)
+        if self.validator is None:
+            raise ValueError("No schema to validate against; call create_schema or pass schema to Dataset")
+        return list(self.validator(rows))
+
+    def overwrite(self, data):
+        """ Replaces the data with data (an iterable of rows or a mapping of column name to values). """
+        self._drop_snapshots()
+        return self._upload(data, append=False)
+
+    def append(self, data):
+        """ Appends data (an iterable of rows or a mapping of column name to values). """
+        self._drop_snapshots()
+        return self._upload(data, append=True)
+
+    def sync(self, data, unique_by: list = None, snapshot_dir: str = None):
+        """ Uploads only the records that were inserted or changed since the last sync.
+
+        A fingerprint of every record, keyed by its `unique_by` fields, is kept
+        in a local snapshot (per api key and dataset).  Records that are new or
+        whose fingerprint changed are appended (geckoboard updates rows that
+        match on `unique_by`).  The whole dataset is overwritten instead when
+        rows were deleted, when there is no snapshot yet, or when the dataset
+        has no `unique_by` fields (in which case no snapshot is kept).
+        `append`, `overwrite`, `clear` and `delete` drop the snapshot, so the
+        next sync after them overwrites.
+
+        Args:
+            data: The complete set of records the dataset should hold.
+            unique_by: The fields that identify a record.  If None, they are
+                taken from the dataset's schema.
+            snapshot_dir: Where snapshots are kept (defaults to SNAPSHOT_DIR).
+
+        Returns:
+            (dict): Counts of `inserted`, `changed` and `deleted` records and
+            whether the dataset was `overwritten`.
+
+        Raises:
+            ValueError: If records share the same `unique_by` values.
+        """
+        if unique_by is None:
+            unique_by = (self.get_schema() or {}).get('unique_by', [])
+
+        records = self.dates_to_isoformat(self._as_rows(data))
+        if not unique_by:
+            self.overwrite(records)
+            return dict(inserted=len(records), changed=0, deleted=0, overwritten=True)
+
+        keys = [tuple(record.get(field) for field in unique_by) for record in records]
+        fingerprints = {key: self._fingerprint(record) for key, record in zip(keys, records)}
+        if len(fingerprints) != len(keys):
+            seen = set()
+            duplicate = next(key for key in keys if key in seen or seen.add(key))
+            raise ValueError(f"Records share the same {unique_by} values: {duplicate!r}")
+
+        snapshot_dir = snapshot_dir or self.SNAPSHOT_DIR
+        self._snapshot_dirs.add(snapshot_dir)
+        pickler = Pickler(snapshot_dir, data_dir='')
+        try:
+            previous = pickler.get_from_key(self._snapshot_key())
+        except FileNotFoundError:
+            previous = None
+
+        stats = dict(inserted=len(fingerprints), changed=0, deleted=0, overwritten=False)
+        if previous is not None:
+            stats['inserted'] = sum(1 for key in fingerprints if key not in previous)
+            stats['changed'] = sum(1 for key, digest in fingerprints.items() if previous.get(key, digest) != digest)
+            stats['deleted'] = sum(1 for key in previous if key not in fingerprints)
+
+        if previous is None or stats['deleted']:
+            self.overwrite(records)
+            stats['overwritten'] = True
+        else:
+            changed = [record for key, record in zip(keys, records) if previous.get(key) != fingerprints[key]]
+            for chunk in each_slice(self.MAX_APPEND_RECORDS, changed):
+                self.append(chunk)
+
+        pickler.write_to_key(self._snapshot_key(), fingerprints)
+        return stats
+
+    def _snapshot_key(self):
+        """ The snapshot's name: the dataset id plus a digest of the api key (which is not written out). """
+        api_key_digest = hashlib.blake2b(self._key_from_auth_params().encode(), digest_size=8).hexdigest()
+        return f"{self.dataset_id}.{api_key_digest}"
+
+    def _drop_snapshots(self):
+        """ Forgets what sync last sent, since the dataset's data is being changed some other way. """
+        filename = self._snapshot_key() + Pickler.EXT
+        for snapshot_dir in list(self._snapshot_dirs):
+            try:
+                os.remove(os.path.join(snapshot_dir, filename))
+            except FileNotFoundError:
+                pass
+
+    @staticmethod
+    def _fingerprint(record):
+        """ A short digest of the record's contents. """
+        as_json = json.dumps(record, sort_keys=True, default=str)
+        return hashlib.blake2b(as_json.encode(), digest_size=16).digest()
+
+    def delete(self):
+        """ Delete the schema and all data in it.
+
+        Returns:
+            None if successful, the response object if unsuccessful.
+        """
+        url = self.DATASETS_ENDPOINT_FORMAT_STR.format(self.dataset_id)
+        self._request('delete', url, **self.auth_params)
+        self._schema_fingerprints.pop(self._fingerprint_key(), None)
+        self._drop_snapshots()
+        self._get_catalog(self._key_from_auth_params()).discard(self.dataset_id)
+
+    def clear(self):
+        """ Clears the data in the dataset without changing the schema. """
+        self.overwrite([])
+
+    def _date_like_to_isoformat(self, value):
+        """ Transforms date or datetime to isoformat. """
+        if isinstance(value, date):
+            return value.isoformat()
+        elif isinstance(value, datetime):
+            return value.isoformat().replace(' ', 'T')
+        else:
+            return value
+
+    def dates_to_isoformat(self, data):
+        return [{key: self._date_like_to_isoformat(value) for key, value in datum.items()} for datum in data]
+
+    @staticmethod
+    def _as_rows(data):
+        """ Returns data as an iterable of rows, lazily exploding it if it is column-oriented. """
+        return columns_to_rows(data) if is_columnar(data) else data
+
+    def _upload(self, data, append):
+        """ Appends (or overwrites with) data.
+
+        The payload is encoded row by row straight to bytes (see
+        encode_payload), so data may be any iterable of records, including a
+        generator, and is never copied as a whole.
+        """
+        url = self.DATA_ENDPOINT_FORMAT_STR.format(self.dataset_id)
+        method = 'post' if append else 'put'
+        headers = {'Content-Type': 'application/json'}
+        rows = self._as_rows(data)
+        if self.validator is not None:
+            rows = self.validator(rows)
+        body = encode_payload(rows)
+        if self.compress:
+            body = compress_payload(body)
+            headers['Content-Encoding'] = 'gzip'
+        with body:
+            if self.spool is not None and self.spool.holds(self.dataset_id):
+                # sending now would land ahead of the older uploads waiting in the spool
+                self._spool_payload(body, append)
+                return
+            try:
+                # with a spool, an outage costs one attempt; the replayer does the retrying
+                max_retries = None if self.spool is None else 0
+                self._request(method, url, max_retries=max_retries, data=body, headers=headers, **self.auth_params)
+            except (ResponseError, requests.RequestException) as exc:
+                if self.spool is None or not self._is_unavailable(exc):
+                    raise
+                self._spool_payload(body, append)
+
+    def _spool_payload(self, body, append):
+        self.spool.put_payload(self.dataset_id, body, append=append, compressed=self.compress)
+        self.spooled_count += 1
+
+    @staticmethod
+    def _is_unavailable(exc):
+        """ Whether exc means geckoboard could not take the request (rather than rejecting it). """
+        if isinstance(exc, ResponseError):
+            return exc.response.status_code in RequestScheduler.RETRY_STATUSES
+        return True
+
+    @staticmethod
+    def _ensure_response_ok(response):
+        # print("STATUS CODE", response.status_code)
+        # print("RESPONSE", response.json())
+        if not response.ok:
+            raise ResponseError(response=response)
+
+    def _store_schema(self, response):
+        """ Puts the schema returned from creating it into the catalog. """
+        catalog = self._get_catalog(self._key_from_auth_params())
+        try:
+            schema = response.json()
+        except ValueError:
+            schema = None
+        if isinstance(schema, dict) and schema.get('id') == self.dataset_id:
+            catalog.store(schema)
+        else:
+            catalog.invalidate()
+
+    def get_schema(self, refresh: bool = False):
+        """ Returns this dataset's schema (or None if the dataset does not exist).
+
+        Args:
+            refresh: whether to fetch the listing even if the cached one is fresh.
+        """
+        return self._get_catalog(self._key_from_auth_params()).get(self.dataset_id, refresh=refresh)
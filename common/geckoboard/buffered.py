@@ -0,0 +1,191 @@
+""" A Dataset that batches appends and pushes them from a background thread. """
+import atexit
+import json
+import queue
+import threading
+import time
+
+from common.geckoboard import Dataset
+
+_FLUSH = object()
+_CLOSE = object()
+
+
+class _Batch:
+    """ Accumulates records until a record count or byte size limit is hit. """
+
+    def __init__(self, max_records, max_bytes):
+        self.max_records = max_records
+        self.max_bytes = max_bytes
+        self.records = []
+        self.num_bytes = 0
+
+    def __len__(self):
+        return len(self.records)
+
+    def fits(self, num_bytes, num_records=1):
+        """ Whether num_records totalling num_bytes can be added without going over the limits.
+
+        Anything fits into an empty batch.
+        """
+        if not self.records:
+            return True
+        return (
+            len(self.records) + num_records <= self.max_records and self.num_bytes + num_bytes <= self.max_bytes
+        )
+
+    def add(self, record, num_bytes):
+        self.records.append(record)
+        self.num_bytes += num_bytes
+
+    def extend(self, records, num_bytes):
+        self.records.extend(records)
+        self.num_bytes += num_bytes
+
+    def is_full(self):
+        return len(self.records) >= self.max_records or self.num_bytes >= self.max_bytes
+
+
+class BufferedDataset(Dataset):
+    """ A Dataset whose appends are queued in memory and pushed in batches.
+
+    Records given to `append` go into a bounded queue and return immediately.
+    A background thread sends them with a single request per batch whenever
+    `max_records` or `max_bytes` is reached, or when the oldest record in the
+    batch has waited `max_latency` seconds.  If the queue is full, records are
+    dropped (and counted) rather than blocking the caller.  `overwrite`,
+    `clear`, `sync` and `delete` flush the queue first, so they are applied
+    after the records appended before them.
+
+    Example:
+        dataset = BufferedDataset('some.id', max_latency=2.0)
+        dataset.append([dict(tpl='14', timestamp=datetime, num_orders=22)])
+        ...
+        dataset.flush()  # blocks until everything queued so far is sent
+        dataset.close()  # flushes and stops the thread (also run at exit)
+
+    Attributes:
+        flushed_count (int): Number of records successfully sent (or, if the
+            dataset has a spool, written to it after a failed upload).
+        dropped_count (int): Number of records dropped because the queue was full.
+        failed_count (int): Number of records in batches that failed to send.
+        last_error (Exception): The most recent error raised by a batch upload.
+    """
+    MAX_RECORDS = Dataset.MAX_APPEND_RECORDS
+    MAX_BYTES = 1000000
+    MAX_LATENCY = 5.0
+    MAX_QUEUED = 10000
+
+    def __init__(
+        self,
+        dataset_id: str,
+        api_key: str = None,
+        max_records: int = MAX_RECORDS,
+        max_bytes: int = MAX_BYTES,
+        max_latency: float = MAX_LATENCY,
+        max_queued: int = MAX_QUEUED,
+        spool=None,
+    ):
+        super().__init__(dataset_id, api_key=api_key, spool=spool)
+        self.max_records = max_records
+        self.max_bytes = max_bytes
+        self.max_latency = max_latency
+
+        self.flushed_count = 0
+        self.dropped_count = 0
+        self.failed_count = 0
+        self.last_error = None
+
+        self._queue = queue.Queue(maxsize=max_queued)
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name=f"geckoboard-{dataset_id}", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def append(self, data):
+        """ Queues rows (or columns, as with Dataset.append) to be appended.  Never blocks on the network. """
+        if self._closed:
+            raise RuntimeError(f"BufferedDataset {self.dataset_id!r} is closed")
+        self._drop_snapshots()
+        for datum in self._as_rows(data):
+            record = {key: self._date_like_to_isoformat(value) for key, value in datum.items()}
+            try:
+                self._queue.put_nowait((record, len(json.dumps(record))))
+            except queue.Full:
+                self.dropped_count += 1
+
+    def overwrite(self, data):
+        """ Sends everything queued so far, then replaces the data with data. """
+        self.flush()
+        return super().overwrite(data)
+
+    def sync(self, data, unique_by: list = None, snapshot_dir: str = None):
+        """ Sends everything queued so far, then syncs data (see Dataset.sync) and sends the changes. """
+        self.flush()
+        stats = super().sync(data, unique_by=unique_by, snapshot_dir=snapshot_dir)
+        self.flush()
+        return stats
+
+    def delete(self):
+        """ Sends everything queued so far, then deletes the dataset. """
+        self.flush()
+        return super().delete()
+
+    def flush(self):
+        """ Sends everything queued so far and waits until it has been sent. """
+        if self._closed:
+            return
+        self._queue.put(_FLUSH)
+        self._queue.join()
+
+    def close(self):
+        """ Flushes the queue and stops the background thread. """
+        if self._closed:
+            return
+        self._closed = True
+        atexit.unregister(self.close)
+        self._queue.put(_CLOSE)
+        self._thread.join()
+
+    def _new_batch(self):
+        return _Batch(self.max_records, self.max_bytes)
+
+    def _run(self):
+        batch = self._new_batch()
+        deadline = None
+        while True:
+            timeout = None if deadline is None else max(deadline - time.monotonic(), 0)
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                batch, deadline = self._send(batch), None
+                continue
+
+            if item is _FLUSH or item is _CLOSE:
+                batch, deadline = self._send(batch), None
+                self._queue.task_done()
+                if item is _CLOSE:
+                    return
+                continue
+
+            record, num_bytes = item
+            if not batch.fits(num_bytes):
+                batch, deadline = self._send(batch), None
+            batch.add(record, num_bytes)
+            self._queue.task_done()
+            if deadline is None:
+                deadline = time.monotonic() + self.max_latency
+            if batch.is_full():
+                batch, deadline = self._send(batch), None
+
+    def _send(self, batch):
+        """ Uploads the batch (if any) and returns a fresh one. """
+        if batch:
+            try:
+                self._upload(batch.records, append=True)
+            except Exception as exc:
+                self.failed_count += len(batch)
+                self.last_error = exc
+            else:
+                self.flushed_count += len(batch)
+        return self._new_batch()
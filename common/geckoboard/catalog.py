@@ -0,0 +1,93 @@
+""" A TTL cache of the dataset schemas in a geckoboard account. """
+import copy
+import threading
+import time
+
+
+class SchemaCatalog:
+    """ Caches the full listing of dataset schemas, indexed by id.
+
+    The listing is fetched at most once per `ttl` seconds.  Lookups return
+    copies, so callers may modify what they get back.  Changes made
+    through this process are applied with `store` (after a schema is
+    created) and `discard` (after a dataset is deleted) so that they do not
+    require another listing.
+
+    Example:
+        catalog = SchemaCatalog.for_api_key(api_key, fetch=lambda: list_all_schemas(api_key))
+        catalog.get('some.id')  # fetches the listing the first time only
+    """
+    TTL = 300
+
+    _catalogs = {}
+    _catalogs_lock = threading.Lock()
+
+    @classmethod
+    def for_api_key(cls, api_key: str, fetch, ttl: float = TTL, endpoint: str = None):
+        """ Returns the catalog shared by everything using api_key (against endpoint).
+
+        Args:
+            api_key: The geckoboard api key.
+            fetch: Called with no arguments to list every schema in the account
+                (only used when the catalog is first created).
+            ttl: Seconds before the listing is considered stale.
+            endpoint: The datasets endpoint fetch lists, so datasets pointed
+                at different servers don't share a catalog.
+        """
+        key = (endpoint, api_key)
+        with cls._catalogs_lock:
+            if key not in cls._catalogs:
+                cls._catalogs[key] = cls(fetch, ttl=ttl)
+            return cls._catalogs[key]
+
+    def __init__(self, fetch, ttl: float = TTL):
+        self._fetch = fetch
+        self.ttl = ttl
+        self._index = {}
+        self._loaded_at = None
+        self._lock = threading.Lock()
+
+    def is_fresh(self):
+        loaded_at = self._loaded_at
+        return loaded_at is not None and time.monotonic() - loaded_at < self.ttl
+
+    def load(self, schemas):
+        """ Replaces the catalog with a full listing of schemas. """
+        index = {schema['id']: schema for schema in schemas}
+        with self._lock:
+            self._index = index
+            self._loaded_at = time.monotonic()
+
+    def refresh(self):
+        """ Fetches the listing now and returns it. """
+        schemas = self._fetch()
+        self.load(copy.deepcopy(schemas))
+        return schemas
+
+    def schemas(self, refresh: bool = False):
+        """ Returns every schema, fetching the listing if it is stale. """
+        if refresh or not self.is_fresh():
+            return self.refresh()
+        return copy.deepcopy(list(self._index.values()))
+
+    def get(self, dataset_id: str, refresh: bool = False):
+        """ Returns the schema for dataset_id (or None if there is no such dataset). """
+        if refresh or not self.is_fresh():
+            self.refresh()
+        return copy.deepcopy(self._index.get(dataset_id))
+
+    def store(self, schema: dict):
+        """ Adds or replaces a single schema. """
+        with self._lock:
+            index = dict(self._index)
+            index[schema['id']] = schema
+            self._index = index
+
+    def discard(self, dataset_id: str):
+        """ Removes a schema (for example, once its dataset has been deleted). """
+        with self._lock:
+            self._index = {key: value for key, value in self._index.items() if key != dataset_id}
+
+    def invalidate(self):
+        """ Forces the next lookup to fetch the listing again. """
+        self._loaded_at = None
@@ -0,0 +1,59 @@
+""" Support for column-oriented data (including numpy arrays) in Dataset uploads. """
+from collections.abc import Mapping
+from datetime import date
+
+# numpy datetime64 units coarser than a day are sent as dates
+_DATE_UNITS = frozenset(['Y', 'M', 'W', 'D'])
+
+
+def is_columnar(data):
+    """ Whether data is a mapping of column name to values (as opposed to an iterable of rows). """
+    return isinstance(data, Mapping)
+
+
+def _datetime64_to_isoformat(column):
+    import numpy as np
+
+    column = np.asarray(column)
+    unit, _ = np.datetime_data(column.dtype)
+    strings = np.datetime_as_string(column, unit='D' if unit in _DATE_UNITS else 's').astype(object)
+    strings[np.isnat(column)] = None
+    return strings.tolist()
+
+
+def column_to_values(column):
+    """ Returns the column as a list of json-friendly values.
+
+    numpy datetime64 columns are converted to isoformat strings in a single
+    vectorized pass (NaT becomes None), other numpy columns are converted
+    to python scalars with `tolist`, and plain sequences have their dates
+    and datetimes converted to isoformat strings.
+    """
+    dtype = getattr(column, 'dtype', None)
+    if dtype is not None:
+        if dtype.kind == 'M':
+            return _datetime64_to_isoformat(column)
+        return column.tolist()
+
+    values = list(column)
+    if any(isinstance(value, date) for value in values):
+        return [value.isoformat() if isinstance(value, date) else value for value in values]
+    return values
+
+
+def columns_to_rows(columns):
+    """ Lazily yields one dict per row from a mapping of column name to values.
+
+    Each column is converted once, up front (see column_to_values); rows
+    are only built as they are consumed.
+
+    Example:
+        rows = columns_to_rows(dict(tpl=['13', '14'], num_orders=np.array([54, 22])))
+        list(rows)  # => [{'tpl': '13', 'num_orders': 54}, {'tpl': '14', 'num_orders': 22}]
+    """
+    names = list(columns)
+    values = [column_to_values(columns[name]) for name in names]
+    lengths = {len(column) for column in values}
+    if len(lengths) > 1:
+        raise ValueError(f"All columns must be the same length, got lengths {sorted(lengths)}")
+    return (dict(zip(names, row)) for row in zip(*values))
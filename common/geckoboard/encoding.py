@@ -0,0 +1,86 @@
+""" Streaming encoding of geckoboard upload payloads. """
+import gzip
+import os
+import shutil
+import tempfile
+
+from common.json.codecs import DatetimeJSONEncoder
+
+# bytes held in memory before a payload spills over to a temporary file
+SPOOL_SIZE = 1 << 20
+CHUNK_SIZE = 1 << 16
+
+
+def encode_payload(rows, spool_size: int = SPOOL_SIZE):
+    """ Encodes `{"data": rows}` as JSON into a spooled temporary file.
+
+    Rows are encoded one at a time (dates and datetimes become isoformat
+    strings) and written out in chunks, so `rows` can be a generator and the
+    payload is never built up in memory.  Payloads larger than spool_size
+    are kept on disk.
+
+    Returns:
+        (tempfile.SpooledTemporaryFile): The payload, positioned at the start.
+    """
+    encode = DatetimeJSONEncoder(separators=(',', ':')).encode
+    body = tempfile.SpooledTemporaryFile(max_size=spool_size)
+    body.write(b'{"data":[')
+    chunk = []
+    chunk_len = 0
+    separator = ''
+    for row in rows:
+        encoded = separator + encode(row)
+        separator = ','
+        chunk.append(encoded)
+        chunk_len += len(encoded)
+        if chunk_len >= CHUNK_SIZE:
+            body.write(''.join(chunk).encode())
+            chunk = []
+            chunk_len = 0
+    chunk.append(']}')
+    body.write(''.join(chunk).encode())
+    body.seek(0)
+    return body
+
+
+def compress_payload(body, spool_size: int = SPOOL_SIZE):
+    """ Gzips an encoded payload (see encode_payload) into a new spooled temporary file.
+
+    The original file is closed.
+    """
+    compressed = tempfile.SpooledTemporaryFile(max_size=spool_size)
+    with body, gzip.GzipFile(fileobj=compressed, mode='wb', mtime=0) as gzipped:
+        shutil.copyfileobj(body, gzipped, CHUNK_SIZE)
+    compressed.seek(0)
+    return compressed
+
+
+class UploadBody:
+    """ A payload file (see encode_payload) as a request body, without a fileno.
+
+    requests sizes file bodies with fileno() when they have one, and asking
+    a SpooledTemporaryFile for its fileno rolls it over to disk.  This gives
+    requests the length through len() instead, so small payloads stay in
+    memory.
+    """
+
+    def __init__(self, payload):
+        self._payload = payload
+        payload.seek(0, os.SEEK_END)
+        self._len = payload.tell()
+        payload.seek(0)
+
+    def __len__(self):
+        return self._len
+
+    def read(self, size=-1):
+        return self._payload.read(size)
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        return self._payload.seek(offset, whence)
+
+    def tell(self):
+        return self._payload.tell()
+
+    def __iter__(self):
+        return iter(lambda: self._payload.read(CHUNK_SIZE), b'')
@@ -0,0 +1,318 @@
+""" A local, in-process stand-in for the geckoboard datasets API.
+
+Useful for tests and load tests that should not (or cannot) talk to
+geckoboard itself.
+
+Example:
+    with FakeGeckoboard(latency=0.01, throttle_every=10) as server:
+        LocalDataset = server.dataset_class()
+        dataset = LocalDataset('some.id', api_key='anything')
+        dataset.create_schema(MySchema)
+        dataset.append(rows)
+        server.datasets['some.id']['data']  # => the rows geckoboard would hold
+"""
+import base64
+import gzip
+import json
+import re
+import socket
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from datetime import timezone
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+
+from common.geckoboard import Dataset
+
+
+@dataclass
+class RequestRecord:
+    """ What the fake server saw of a single request. """
+    method: str
+    path: str
+    status: int
+    # the size of the body as sent (so compressed, if it was gzipped)
+    num_bytes: int
+    duration: float
+
+
+class _HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    ROUTES = [
+        ('GET', re.compile(r'^/datasets/?$'), 'list_datasets'),
+        ('PUT', re.compile(r'^/datasets/([^/]+)/data$'), 'replace_data'),
+        ('POST', re.compile(r'^/datasets/([^/]+)/data$'), 'append_data'),
+        ('PUT', re.compile(r'^/datasets/([^/]+)$'), 'create_dataset'),
+        ('DELETE', re.compile(r'^/datasets/([^/]+)$'), 'delete_dataset'),
+    ]
+
+    def do_GET(self):
+        self._handle()
+
+    def do_PUT(self):
+        self._handle()
+
+    def do_POST(self):
+        self._handle()
+
+    def do_DELETE(self):
+        self._handle()
+
+    def log_message(self, format, *args):
+        pass
+
+    def _handle(self):
+        fake = self.server.fake
+        start = time.monotonic()
+        body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        num_bytes = len(body)
+        try:
+            if fake.latency:
+                time.sleep(fake.latency)
+            fake._check_auth(self.headers.get('Authorization'))
+            if fake._should_throttle():
+                raise _HTTPError(429, "Too many requests")
+            if self.headers.get('Content-Encoding') == 'gzip':
+                body = gzip.decompress(body)
+            status, payload = self._route(body)
+        except _HTTPError as exc:
+            status, payload = exc.status, dict(error=dict(message=exc.message))
+
+        encoded = json.dumps(payload).encode()
+        fake._record(RequestRecord(self.command, self.path, status, num_bytes, time.monotonic() - start))
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(encoded)))
+        if status == 429:
+            self.send_header('Retry-After', str(fake.retry_after))
+        self.end_headers()
+        self.wfile.write(encoded)
+
+    def _route(self, body):
+        for method, pattern, name in self.ROUTES:
+            match = pattern.match(self.path)
+            if method == self.command and match:
+                data = json.loads(body) if body else None
+                return getattr(self.server.fake, name)(*match.groups(), data)
+        raise _HTTPError(404, f"No route for {self.command} {self.path}")
+
+
+class _Server(ThreadingHTTPServer):
+    """ A ThreadingHTTPServer that keeps track of its handler threads so it can stop them.
+
+    ThreadingHTTPServer only waits for non-daemon threads when it closes,
+    and a handler on a keep-alive connection waits for the next request
+    until the client hangs up.
+    """
+    daemon_threads = True
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._handlers = {}
+        self._handlers_lock = threading.Lock()
+
+    def process_request(self, request, client_address):
+        thread = threading.Thread(target=self.process_request_thread, args=(request, client_address), daemon=True)
+        with self._handlers_lock:
+            self._handlers[thread] = request
+        thread.start()
+
+    def process_request_thread(self, request, client_address):
+        try:
+            super().process_request_thread(request, client_address)
+        finally:
+            with self._handlers_lock:
+                self._handlers.pop(threading.current_thread(), None)
+
+    def close_connections(self):
+        """ Ends every open connection once its current request is answered, and waits for its thread. """
+        with self._handlers_lock:
+            handlers = list(self._handlers.items())
+        for _, request in handlers:
+            try:
+                # the handler sees the end of the stream when it goes for the next request
+                request.shutdown(socket.SHUT_RD)
+            except OSError:
+                pass
+        for thread, _ in handlers:
+            thread.join()
+
+
+class FakeGeckoboard:
+    """ Serves the geckoboard dataset endpoints from memory on a local port.
+
+    Args:
+        latency: Seconds to wait before answering each request.
+        throttle_every: If set, every nth request is answered with a 429.
+        retry_after: The Retry-After value sent along with a 429.
+        max_records_per_request: Uploads with more records get a 400.
+        max_records: The most records a dataset holds.  Appends beyond this
+            discard the oldest records (as geckoboard does).
+        api_key: If set, requests with any other api key get a 401.
+
+    Attributes:
+        datasets (dict): Dataset id to dict(schema=..., data=[...]).
+        requests (list): A RequestRecord for every request answered.
+    """
+    MAX_RECORDS_PER_REQUEST = Dataset.MAX_APPEND_RECORDS
+    MAX_RECORDS = 5000
+
+    def __init__(
+        self,
+        latency: float = 0.0,
+        throttle_every: int = 0,
+        retry_after: float = 0,
+        max_records_per_request: int = MAX_RECORDS_PER_REQUEST,
+        max_records: int = MAX_RECORDS,
+        api_key: str = None,
+    ):
+        self.latency = latency
+        self.throttle_every = throttle_every
+        self.retry_after = retry_after
+        self.max_records_per_request = max_records_per_request
+        self.max_records = max_records
+        self.api_key = api_key
+
+        self.datasets = {}
+        self.requests = []
+        self._num_requests = 0
+        self._lock = threading.Lock()
+        self._httpd = None
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._httpd = _Server(('127.0.0.1', 0), _Handler)
+        self._httpd.fake = self
+        self._thread = threading.Thread(
+            target=self._httpd.serve_forever, kwargs=dict(poll_interval=0.01), name="fake-geckoboard", daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.close_connections()
+        self._httpd.server_close()
+        self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def dataset_class(self, base=Dataset):
+        """ Returns a subclass of base (Dataset or a subclass of it) that talks to this server. """
+        datasets_endpoint = self.url + "/datasets"
+        return type(f"Local{base.__name__}", (base,), dict(
+            BASE_URL=self.url,
+            DATASETS_ENDPOINT=datasets_endpoint,
+            DATASETS_ENDPOINT_FORMAT_STR=datasets_endpoint + "/{}",
+            DATA_ENDPOINT_FORMAT_STR=datasets_endpoint + "/{}/data",
+        ))
+
+    def _record(self, record):
+        with self._lock:
+            self.requests.append(record)
+
+    def _should_throttle(self):
+        with self._lock:
+            self._num_requests += 1
+            return bool(self.throttle_every) and self._num_requests % self.throttle_every == 0
+
+    def _check_auth(self, authorization):
+        if self.api_key is None:
+            return
+        try:
+            api_key = base64.b64decode(authorization.split()[1]).decode().split(':')[0]
+        except (AttributeError, IndexError, ValueError):
+            api_key = None
+        if api_key != self.api_key:
+            raise _HTTPError(401, "Your API key is invalid")
+
+    def _get_dataset(self, dataset_id):
+        try:
+            return self.datasets[dataset_id]
+        except KeyError:
+            raise _HTTPError(404, f"Dataset not found: {dataset_id}")
+
+    @staticmethod
+    def _now():
+        return datetime.now(timezone.utc).isoformat().replace('+00:00', 'Z')
+
+    def list_datasets(self, data):
+        with self._lock:
+            return 200, dict(data=[dataset['schema'] for dataset in self.datasets.values()])
+
+    def create_dataset(self, dataset_id, data):
+        if not data or not data.get('fields'):
+            raise _HTTPError(400, "Fields are required")
+        fields = {
+            key: dict(type=field['type'], optional=not field.get('required', True), name=field.get('name', key))
+            for key, field in data['fields'].items()
+        }
+        with self._lock:
+            existing = self.datasets.get(dataset_id)
+            if existing:
+                if existing['schema']['fields'] != fields:
+                    raise _HTTPError(409, "Fields do not match the existing dataset")
+                return 200, existing['schema']
+            now = self._now()
+            schema = dict(id=dataset_id, fields=fields, created_at=now, updated_at=now)
+            if data.get('unique_by'):
+                schema['unique_by'] = data['unique_by']
+            self.datasets[dataset_id] = dict(schema=schema, data=[])
+            return 201, schema
+
+    def delete_dataset(self, dataset_id, data):
+        with self._lock:
+            self._get_dataset(dataset_id)
+            del self.datasets[dataset_id]
+        return 200, {}
+
+    def _records_from(self, data):
+        records = (data or {}).get('data')
+        if not isinstance(records, list):
+            raise _HTTPError(400, "data must be an array")
+        if len(records) > self.max_records_per_request:
+            raise _HTTPError(400, f"At most {self.max_records_per_request} records may be sent at once")
+        return records
+
+    def replace_data(self, dataset_id, data):
+        records = self._records_from(data)
+        with self._lock:
+            dataset = self._get_dataset(dataset_id)
+            dataset['data'] = records[-self.max_records:]
+        return 200, {}
+
+    def append_data(self, dataset_id, data):
+        records = self._records_from(data)
+        with self._lock:
+            dataset = self._get_dataset(dataset_id)
+            unique_by = dataset['schema'].get('unique_by')
+            if unique_by:
+                rows = {tuple(row.get(key) for key in unique_by): row for row in dataset['data']}
+                for record in records:
+                    key = tuple(record.get(key) for key in unique_by)
+                    rows.pop(key, None)
+                    rows[key] = record
+                merged = list(rows.values())
+            else:
+                merged = dataset['data'] + records
+            dataset['data'] = merged[-self.max_records:]
+        return 200, {}
@@ -0,0 +1,166 @@
+""" Client-side pre-aggregation of events into time buckets before they are uploaded. """
+import threading
+from datetime import datetime
+from datetime import timedelta
+
+from common.datetime_utils import ensure_timezone
+from common.enumerable import each_slice
+from common.geckoboard import Field
+from common.geckoboard import Types
+
+AGGREGATES = ('count', 'sum', 'min', 'max')
+
+# buckets are counted from here, in local (wall clock) time
+_EPOCH = datetime(1970, 1, 1)
+
+
+class Rollup:
+    """ Buckets events by time and grouping fields and appends one row per bucket.
+
+    Rather than appending one row per event, events are added to the rollup,
+    which keeps count/sum/min/max aggregates per bucket.  A bucket is the
+    event's time floored to `granularity` (in `timezone`) plus the values of
+    the `group_by` fields.  `flush` appends a row for every bucket that
+    changed since the last flush.  Since the time and group fields make up
+    the dataset's unique_by, a late event re-sends its bucket's row and
+    geckoboard updates it in place.  Buckets are kept for `retention` behind
+    the newest event; events older than that are dropped and counted in
+    `late_dropped`, since re-sending their bucket would undercount it.
+
+    Example:
+        rollup = Rollup(
+            dataset,
+            time_field='shipped_at',
+            granularity=timedelta(minutes=1),
+            timezone='America/Denver',
+            group_by=['tpl'],
+            aggregates=dict(num_orders=('count', None), total=('sum', 'amount'), biggest=('max', 'amount')),
+        )
+        dataset.ensure_schema(rollup.schema())
+
+        rollup.add(events)
+        rollup.flush()
+    """
+    GRANULARITY = timedelta(minutes=1)
+    RETENTION = timedelta(hours=1)
+
+    def __init__(
+        self,
+        dataset,
+        time_field: str,
+        granularity: timedelta = GRANULARITY,
+        timezone='UTC',
+        group_by=(),
+        aggregates: dict = None,
+        retention: timedelta = RETENTION,
+    ):
+        """
+        Args:
+            dataset (Dataset): Where the rolled up rows are appended.
+            time_field: The event field holding its datetime.
+            granularity: The width of a time bucket.
+            timezone (str or pytz.timezone): Buckets are aligned to wall clock
+                time here, and naive datetimes are taken to be in it.
+            group_by: Event fields whose values also define a bucket.
+            aggregates: Output field name to (aggregate, event field), where
+                aggregate is one of AGGREGATES.  The event field is ignored
+                for 'count'.  Defaults to dict(count=('count', None)).
+            retention: How far behind the newest event buckets are kept.
+        """
+        self.dataset = dataset
+        self.time_field = time_field
+        self.granularity = granularity
+        self.timezone = ensure_timezone(timezone)
+        self.group_by = tuple(group_by)
+        self.aggregates = dict(aggregates or dict(count=('count', None)))
+        self.retention = retention
+        for name, (aggregate, _) in self.aggregates.items():
+            if aggregate not in AGGREGATES:
+                raise ValueError(f"Unknown aggregate {aggregate!r} for {name!r}; expected one of {AGGREGATES}")
+
+        self.late_dropped = 0
+        self._buckets = {}
+        self._dirty = set()
+        self._newest = None
+        self._lock = threading.Lock()
+
+    def schema(self):
+        """ Returns a schema (for create_schema/ensure_schema) matching the rows appended. """
+        schema = {self.time_field: Field(Types.DATETIME, required=True, unique=True)}
+        schema.update({name: Field(Types.STRING, unique=True) for name in self.group_by})
+        schema.update({name: Field(Types.NUMBER) for name in self.aggregates})
+        return schema
+
+    def bucket_start(self, value: datetime) -> datetime:
+        """ Floors value to the granularity, in the rollup's timezone. """
+        local = value if value.tzinfo is None else value.astimezone(self.timezone).replace(tzinfo=None)
+        start = _EPOCH + (local - _EPOCH) // self.granularity * self.granularity
+        if hasattr(self.timezone, 'localize'):
+            return self.timezone.localize(start)
+        return start.replace(tzinfo=self.timezone)
+
+    def add(self, events):
+        """ Adds events (dicts) to their buckets. """
+        with self._lock:
+            for event in events:
+                start = self.bucket_start(event[self.time_field])
+                if self._newest is not None and start < self._newest - self.retention:
+                    self.late_dropped += 1
+                    continue
+                if self._newest is None or start > self._newest:
+                    self._newest = start
+
+                key = (start,) + tuple(event.get(name) for name in self.group_by)
+                state = self._buckets.get(key)
+                if state is None:
+                    state = self._buckets[key] = {name: None for name in self.aggregates}
+                for name, (aggregate, field) in self.aggregates.items():
+                    state[name] = self._update(aggregate, state[name], event.get(field))
+                self._dirty.add(key)
+
+    @staticmethod
+    def _update(aggregate, current, value):
+        if aggregate == 'count':
+            return (current or 0) + 1
+        if value is None:
+            return current
+        if current is None:
+            return value
+        if aggregate == 'sum':
+            return current + value
+        if aggregate == 'min':
+            return min(current, value)
+        return max(current, value)
+
+    def _row(self, key):
+        row = {self.time_field: key[0]}
+        row.update(zip(self.group_by, key[1:]))
+        row.update(self._buckets[key])
+        return row
+
+    def flush(self):
+        """ Appends a row for every bucket that changed since the last flush.
+
+        Returns:
+            (int): The number of rows appended.
+        """
+        with self._lock:
+            keys = sorted(self._dirty, key=lambda key: (key[0], repr(key[1:])))
+            rows = [self._row(key) for key in keys]
+            self._dirty.clear()
+
+        try:
+            for chunk in each_slice(self.dataset.MAX_APPEND_RECORDS, rows):
+                self.dataset.append(chunk)
+        except Exception:
+            with self._lock:
+                self._dirty.update(keys)
+            raise
+
+        with self._lock:
+            if self._newest is not None:
+                cutoff = self._newest - self.retention
+                self._buckets = {
+                    key: state for key, state in self._buckets.items() if key[0] >= cutoff or key in self._dirty
+                }
+        return len(rows)
@@ -0,0 +1,170 @@
+""" Client-side rate limiting and retries for geckoboard requests. """
+import random
+import threading
+import time
+from dataclasses import dataclass
+from email.utils import parsedate_to_datetime
+
+
+@dataclass
+class SchedulerStats:
+    """ Counters describing the requests sent through a RequestScheduler. """
+    requests: int = 0
+    retries: int = 0
+    throttled: int = 0
+    queue_time: float = 0.0
+    max_queue_time: float = 0.0
+
+
+class TokenBucket:
+    """ A thread-safe token bucket refilling at `rate` tokens/second up to `capacity`. """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        if now > self._updated:
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+
+    def acquire(self):
+        """ Blocks until a token is available.
+
+        Returns:
+            (float): The number of seconds spent waiting.
+        """
+        start = time.monotonic()
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if now >= self._updated and self._tokens >= 1:
+                    self._tokens -= 1
+                    return now - start
+                wait = max(self._updated - now, 0) + (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+    def pause(self, seconds: float):
+        """ Empties the bucket and holds every caller back for `seconds`. """
+        with self._lock:
+            self._tokens = 0
+            self._updated = max(self._updated, time.monotonic() + seconds)
+
+
+def parse_retry_after(value):
+    """ Returns the number of seconds a Retry-After header asks to wait (or None).
+
+    The header is either a number of seconds or an HTTP date.
+    """
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(retry_at.timestamp() - time.time(), 0.0)
+
+
+class RequestScheduler:
+    """ Sends requests within a rate limit and retries the ones that were throttled.
+
+    One scheduler is shared by everything using the same api key (see
+    `for_api_key`), so all Dataset instances for an account draw from the
+    same token bucket.  Responses with a status in RETRY_STATUSES are retried
+    up to `max_retries` times, waiting for as long as the Retry-After header
+    asks or else with jittered exponential backoff.  A 429 pauses the whole
+    bucket, not only the request that got it.
+
+    Example:
+        scheduler = RequestScheduler.for_api_key(api_key)
+        response = scheduler.call(lambda: requests.get(url, auth=(api_key, '')))
+        scheduler.stats  # => SchedulerStats(requests=1, retries=0, ...)
+    """
+    RATE = 1.0
+    BURST = 60
+    MAX_RETRIES = 5
+    BACKOFF = 0.5
+    MAX_BACKOFF = 60.0
+    RETRY_STATUSES = frozenset([429, 500, 502, 503, 504])
+
+    _schedulers = {}
+    _schedulers_lock = threading.Lock()
+
+    @classmethod
+    def for_api_key(cls, api_key: str):
+        """ Returns the scheduler shared by everything using api_key. """
+        with cls._schedulers_lock:
+            if api_key not in cls._schedulers:
+                cls._schedulers[api_key] = cls()
+            return cls._schedulers[api_key]
+
+    @classmethod
+    def configure(cls, api_key: str, **kwargs):
+        """ Replaces the shared scheduler for api_key with one built from kwargs. """
+        with cls._schedulers_lock:
+            cls._schedulers[api_key] = scheduler = cls(**kwargs)
+        return scheduler
+
+    def __init__(
+        self,
+        rate: float = RATE,
+        burst: float = BURST,
+        max_retries: int = MAX_RETRIES,
+        backoff: float = BACKOFF,
+        max_backoff: float = MAX_BACKOFF,
+    ):
+        self.bucket = TokenBucket(rate, burst)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.stats = SchedulerStats()
+        self._stats_lock = threading.Lock()
+
+    def call(self, send, max_retries: int = None):
+        """ Calls `send` once a token is available, retrying throttled responses.
+
+        Args:
+            send: A callable taking no arguments that sends the request and
+                returns the response.  It is called again for every retry.
+            max_retries: Overrides the scheduler's max_retries for this call.
+
+        Returns:
+            The last response (which may still be an error if retries ran out).
+        """
+        max_retries = self.max_retries if max_retries is None else max_retries
+        attempt = 0
+        while True:
+            waited = self.bucket.acquire()
+            response = send()
+            throttled = response.status_code == 429
+            with self._stats_lock:
+                self.stats.requests += 1
+                self.stats.queue_time += waited
+                self.stats.max_queue_time = max(self.stats.max_queue_time, waited)
+                self.stats.throttled += throttled
+
+            if response.status_code not in self.RETRY_STATUSES or attempt >= max_retries:
+                return response
+
+            delay = self._retry_delay(response, attempt)
+            attempt += 1
+            with self._stats_lock:
+                self.stats.retries += 1
+            if throttled:
+                self.bucket.pause(delay)
+            else:
+                time.sleep(delay)
+
+    def _retry_delay(self, response, attempt):
+        retry_after = parse_retry_after(response.headers.get('Retry-After'))
+        if retry_after is not None:
+            return min(retry_after, self.max_backoff) * random.uniform(1.0, 1.1)
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
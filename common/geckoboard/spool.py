@@ -0,0 +1,245 @@
+""" A disk-spooled dead-letter queue for geckoboard uploads that failed.
+
+Example:
+    spool = DeadLetterSpool('/var/spool/geckoboard')
+    dataset = Dataset('some.id', spool=spool)
+    dataset.append(rows)  # if geckoboard is down, the rows go to the spool instead
+
+    replayer = SpoolReplayer(spool)
+    replayer.start()  # re-sends spooled batches in the background
+"""
+import gzip
+import json
+import os
+import shutil
+import threading
+
+from common.geckoboard import Dataset
+from common.geckoboard import ResponseError
+from common.geckoboard.buffered import BufferedDataset
+from common.geckoboard.buffered import _Batch
+from common.geckoboard.encoding import CHUNK_SIZE
+from common.geckoboard.encoding import encode_payload
+
+
+class DeadLetterSpool:
+    """ An append-only JSONL file of failed uploads plus an index of how far it has been replayed.
+
+    Each line holds one upload: `{"dataset_id": ..., "append": ..., "payload": {"data": [...]}}`.
+    The index file holds the byte offset of the first line not yet replayed.
+    Once everything has been replayed, both files are truncated.  Uploads
+    geckoboard rejects outright are moved to a separate rejected file, with
+    the error, for someone to look at.
+    """
+    FILENAME = "spool.jsonl"
+    INDEX_FILENAME = "spool.index"
+    REJECTED_FILENAME = "rejected.jsonl"
+
+    def __init__(self, directory: str, fsync: bool = False):
+        """
+        Args:
+            directory: Where the spool and index files are kept.
+            fsync: Whether to fsync after every write (slower, but survives
+                power loss rather than only process crashes).
+        """
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, self.FILENAME)
+        self.index_path = os.path.join(directory, self.INDEX_FILENAME)
+        self.rejected_path = os.path.join(directory, self.REJECTED_FILENAME)
+        self.fsync = fsync
+        self._lock = threading.Lock()
+
+    def put(self, dataset_id: str, rows, append: bool = True):
+        """ Spools rows bound for dataset_id. """
+        with encode_payload(rows) as payload:
+            self.put_payload(dataset_id, payload, append=append)
+
+    def put_payload(self, dataset_id: str, payload, append: bool = True, compressed: bool = False):
+        """ Spools an already encoded payload (see encode_payload), copying it in chunks.
+
+        Args:
+            payload: A file holding the encoded payload.
+            compressed: Whether the payload is gzipped (see compress_payload).
+        """
+        payload.seek(0)
+        source = gzip.GzipFile(fileobj=payload, mode='rb') if compressed else payload
+        with self._lock, open(self.path, 'ab') as spool_file:
+            spool_file.write(self._header(dataset_id, append) + b', "payload": ')
+            shutil.copyfileobj(source, spool_file, CHUNK_SIZE)
+            spool_file.write(b'}\n')
+            self._sync(spool_file)
+
+    def reject(self, dataset_id: str, records: list, append: bool, error: Exception):
+        """ Sets aside records geckoboard refused (rather than could not take) along with why. """
+        if isinstance(error, ResponseError):
+            error = f"{error.response.status_code} {error.response.text}"
+        entry = dict(dataset_id=dataset_id, append=append, error=str(error), payload=dict(data=records))
+        with self._lock, open(self.rejected_path, 'ab') as rejected_file:
+            rejected_file.write(json.dumps(entry).encode() + b'\n')
+            self._sync(rejected_file)
+
+    @staticmethod
+    def _header(dataset_id, append=None):
+        """ The start of a line for dataset_id (up to its payload, or up to append if that is None). """
+        header = dict(dataset_id=dataset_id) if append is None else dict(dataset_id=dataset_id, append=append)
+        return json.dumps(header)[:-1].encode()
+
+    def _sync(self, open_file):
+        open_file.flush()
+        if self.fsync:
+            os.fsync(open_file.fileno())
+
+    def committed_offset(self):
+        try:
+            with open(self.index_path) as index_file:
+                return int(index_file.read().strip() or 0)
+        except FileNotFoundError:
+            return 0
+
+    def commit(self, offset: int):
+        """ Records that everything before offset has been replayed. """
+        tmp_path = self.index_path + '.tmp'
+        with self._lock:
+            with open(tmp_path, 'w') as index_file:
+                index_file.write(str(offset))
+                self._sync(index_file)
+            os.replace(tmp_path, self.index_path)
+
+    def _pending_lines(self):
+        try:
+            spool_file = open(self.path, 'rb')
+        except FileNotFoundError:
+            return
+        with spool_file:
+            spool_file.seek(self.committed_offset())
+            for line in iter(spool_file.readline, b''):
+                if not line.endswith(b'\n'):
+                    # a write still in progress
+                    return
+                yield spool_file.tell(), line
+
+    def pending(self):
+        """ Yields (end offset, entry) for every upload not yet replayed. """
+        for offset, line in self._pending_lines():
+            yield offset, json.loads(line)
+
+    def holds(self, dataset_id: str):
+        """ Whether any upload for dataset_id is waiting to be replayed.
+
+        Only the start of each line is looked at, so payloads are not parsed.
+        """
+        header = self._header(dataset_id) + b','
+        return any(line.startswith(header) for _, line in self._pending_lines())
+
+    def __len__(self):
+        return sum(1 for _ in self.pending())
+
+    def compact(self):
+        """ Truncates the spool and index if everything has been replayed. """
+        with self._lock:
+            try:
+                size = os.path.getsize(self.path)
+            except FileNotFoundError:
+                return
+            if size and self.committed_offset() >= size:
+                open(self.path, 'wb').close()
+                with open(self.index_path, 'w') as index_file:
+                    index_file.write('0')
+
+
+class SpoolReplayer:
+    """ Re-sends the uploads in a DeadLetterSpool, oldest first.
+
+    Consecutive appends to the same dataset are merged into batches with
+    the same limits as BufferedDataset.  Overwrites are sent one at a time.
+    The spool is only committed past a batch once it has been sent, and a
+    pass stops at the first batch that fails because geckoboard is
+    unavailable, so ordering is kept and nothing is lost.  While passes keep
+    failing, the wait between them doubles, up to MAX_INTERVAL.  A batch
+    geckoboard rejects (a 400, or a 404 once the dataset is deleted) would
+    never go through, so it is moved to the spool's rejected file instead.
+    """
+    INTERVAL = 30.0
+    MAX_INTERVAL = 600.0
+
+    def __init__(
+        self,
+        spool: DeadLetterSpool,
+        api_key: str = None,
+        dataset_class=Dataset,
+        interval: float = INTERVAL,
+        max_records: int = BufferedDataset.MAX_RECORDS,
+        max_bytes: int = BufferedDataset.MAX_BYTES,
+    ):
+        self.spool = spool
+        self.api_key = api_key
+        self.dataset_class = dataset_class
+        self.interval = interval
+        self.max_records = max_records
+        self.max_bytes = max_bytes
+        self.replayed_count = 0
+        self.rejected_count = 0
+        self.last_error = None
+        self._datasets = {}
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _dataset(self, dataset_id):
+        if dataset_id not in self._datasets:
+            self._datasets[dataset_id] = self.dataset_class(dataset_id, api_key=self.api_key)
+        return self._datasets[dataset_id]
+
+    def _batches(self):
+        """ Yields (dataset_id, append, batch, end offset), merging consecutive appends. """
+        key = batch = end = None
+        for offset, entry in self.spool.pending():
+            records = entry['payload']['data']
+            num_bytes = sum(len(json.dumps(record)) for record in records)
+            entry_key = (entry['dataset_id'], entry['append'])
+            if batch is not None and (entry_key != key or not key[1] or not batch.fits(num_bytes, len(records))):
+                yield key[0], key[1], batch, end
+                batch = None
+            if batch is None:
+                key, batch = entry_key, _Batch(self.max_records, self.max_bytes)
+            batch.extend(records, num_bytes)
+            end = offset
+        if batch is not None:
+            yield key[0], key[1], batch, end
+
+    def replay(self):
+        """ Sends everything in the spool.
+
+        Returns:
+            (bool): True if the spool was drained, False if geckoboard was unavailable.
+        """
+        for dataset_id, append, batch, offset in self._batches():
+            try:
+                self._dataset(dataset_id)._upload(batch.records, append=append)
+            except Exception as exc:
+                self.last_error = exc
+                if self.dataset_class._is_unavailable(exc):
+                    return False
+                self.spool.reject(dataset_id, batch.records, append, exc)
+                self.rejected_count += len(batch)
+            else:
+                self.replayed_count += len(batch)
+            self.spool.commit(offset)
+        self.spool.compact()
+        return True
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="geckoboard-spool-replayer", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self):
+        wait = self.interval
+        while not self._stop.is_set():
+            wait = self.interval if self.replay() else min(wait * 2, self.MAX_INTERVAL)
+            self._stop.wait(wait)
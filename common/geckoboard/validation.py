@@ -0,0 +1,154 @@
+""" Local validation of rows against a dataset's fields, before they are uploaded. """
+import math
+import numbers
+import re
+from dataclasses import dataclass
+from datetime import date
+from datetime import datetime
+from decimal import Decimal
+
+DATE_RE = re.compile(r'^\d{4}-\d{2}-\d{2}$')
+DATETIME_RE = re.compile(r'^\d{4}-\d{2}-\d{2}T\d{2}:\d{2}(:\d{2}(\.\d+)?)?(Z|[+-]\d{2}:?\d{2})?$')
+
+
+@dataclass
+class RowError:
+    """ A problem with one field of one row. """
+    index: int
+    field: str
+    message: str
+
+
+class ValidationError(ValueError):
+    """ Raised with every RowError found once all the rows have been checked. """
+
+    def __init__(self, errors):
+        self.errors = errors
+        first = errors[0]
+        super().__init__(
+            f"{len(errors)} invalid field(s); the first is row {first.index}, {first.field!r}: {first.message}"
+        )
+
+
+def _to_number(value):
+    if isinstance(value, bool):
+        raise TypeError(f"expected a number, got {value!r}")
+    if isinstance(value, str):
+        try:
+            return int(value)
+        except ValueError:
+            value = float(value)
+    elif isinstance(value, numbers.Integral):
+        return int(value)
+    elif isinstance(value, (numbers.Real, Decimal)):
+        value = float(value)
+    else:
+        raise TypeError(f"expected a number, got {value!r}")
+    if not math.isfinite(value):
+        raise ValueError(f"expected a finite number, got {value!r}")
+    return value
+
+
+def _to_string(value):
+    if isinstance(value, str):
+        return value
+    if isinstance(value, numbers.Number) and not isinstance(value, bool):
+        return str(value)
+    raise TypeError(f"expected a string, got {value!r}")
+
+
+def _to_date(value):
+    if isinstance(value, datetime):
+        return value.date().isoformat()
+    if isinstance(value, date):
+        return value.isoformat()
+    if isinstance(value, str) and DATE_RE.match(value):
+        return value
+    raise ValueError(f"expected a date (YYYY-MM-DD), got {value!r}")
+
+
+def _to_datetime(value):
+    if isinstance(value, date):
+        return value.isoformat()
+    if isinstance(value, str) and DATETIME_RE.match(value):
+        return value
+    raise ValueError(f"expected an ISO 8601 datetime, got {value!r}")
+
+
+# keyed by the values of common.geckoboard.Types
+COERCERS = dict(
+    number=_to_number,
+    money=_to_number,
+    percentage=_to_number,
+    string=_to_string,
+    date=_to_date,
+    datetime=_to_datetime,
+)
+
+
+def compile_validator(fields):
+    """ Builds a function that checks and coerces rows against fields.
+
+    Args:
+        fields (dict): Field name to Field.
+
+    Returns:
+        A function taking an iterable of rows (dicts) that lazily yields each
+        valid row with its values coerced (numeric strings to numbers, dates
+        to isoformat strings, etc.).  Missing required values, values of the
+        wrong type, fields that are not in the schema and duplicate
+        `unique_by` values are collected by row index.  Once the rows are
+        exhausted, a ValidationError holding every RowError is raised if
+        there were any.
+    """
+    checks = tuple((name, field.required, COERCERS[field.type]) for name, field in sorted(fields.items()))
+    known = frozenset(fields)
+    unique_by = tuple(name for name, field in sorted(fields.items()) if field.unique)
+    unique_by_label = ','.join(unique_by)
+
+    def validate(rows):
+        errors = []
+        seen = set()
+        for index, row in enumerate(rows):
+            num_errors = len(errors)
+            clean = {}
+            for name, required, coerce in checks:
+                value = row.get(name)
+                if value is None:
+                    if required:
+                        errors.append(RowError(index, name, "is required"))
+                    elif name in row:
+                        clean[name] = None
+                    continue
+                try:
+                    clean[name] = coerce(value)
+                except (TypeError, ValueError) as exc:
+                    errors.append(RowError(index, name, str(exc)))
+
+            for name in row.keys() - known:
+                errors.append(RowError(index, name, "is not a field of the dataset"))
+
+            if unique_by and len(errors) == num_errors:
+                key = tuple(clean.get(name) for name in unique_by)
+                if key in seen:
+                    errors.append(RowError(index, unique_by_label, f"duplicates an earlier row: {key!r}"))
+                seen.add(key)
+
+            if len(errors) == num_errors:
+                yield clean
+
+        if errors:
+            raise ValidationError(errors)
+
+    return validate
+
+
+_validators = {}
+
+
+def get_validator(fields):
+    """ Returns the (cached) compiled validator for fields (see compile_validator). """
+    key = tuple((name, field.type, field.required, field.unique) for name, field in sorted(fields.items()))
+    if key not in _validators:
+        _validators[key] = compile_validator(fields)
+    return _validators[key]
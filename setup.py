@@ -11,7 +11,7 @@ setuptools.setup(
     description="common stuff for 3plcentral",
     author="3plcentral",
     author_email="jprince@3plcentral",
-    packages=setuptools.find_packages(exclude=["docs", "tests", ".gitignore", "README.md"]),
+    packages=setuptools.find_packages(exclude=["docs", "tests", "benchmarks", ".gitignore", "README.md"]),
     # TODO: automate this from inspection of pyproject.toml file
     install_requires=[
         'pytz',
@@ -0,0 +1,13 @@
+import uuid
+
+import pytest
+
+from common.geckoboard.scheduler import RequestScheduler
+
+
+@pytest.fixture
+def api_key():
+    """ A fresh api key (and so a fresh scheduler and schema catalog) for each test. """
+    api_key = f"test-{uuid.uuid4().hex}"
+    RequestScheduler.configure(api_key, rate=1000, burst=1000, backoff=0.001)
+    return api_key
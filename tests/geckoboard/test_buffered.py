@@ -0,0 +1,112 @@
+import threading
+import time
+from datetime import datetime
+
+import pytest
+
+from common.geckoboard.buffered import BufferedDataset
+from common.geckoboard.fake_server import FakeGeckoboard
+
+
+@pytest.fixture
+def uploads(monkeypatch):
+    """ Captures the batches that would have been uploaded. """
+    batches = []
+
+    def fake_upload(self, data, append):
+        batches.append(list(data))
+
+    monkeypatch.setattr(BufferedDataset, '_upload', fake_upload)
+    return batches
+
+
+class TestBufferedDataset:
+    """ Test the BufferedDataset. """
+
+    def _dataset(self, **kwargs):
+        return BufferedDataset('test.buffered', api_key='XXXXXXX', **kwargs)
+
+    def test_flush_sends_queued_records(self, uploads):
+        """ Records are sent together on flush and dates are converted. """
+        dataset = self._dataset(max_latency=60)
+        dataset.append([dict(num=1, timestamp=datetime(2020, 1, 2))])
+        dataset.append([dict(num=2, timestamp=datetime(2020, 1, 3))])
+        dataset.flush()
+
+        assert uploads == [[
+            dict(num=1, timestamp='2020-01-02T00:00:00'),
+            dict(num=2, timestamp='2020-01-03T00:00:00'),
+        ]]
+        assert dataset.flushed_count == 2
+        dataset.close()
+
+    def test_max_records(self, uploads):
+        """ Batches are cut at max_records. """
+        dataset = self._dataset(max_records=2, max_latency=60)
+        dataset.append([dict(num=num) for num in range(5)])
+        dataset.close()
+        assert [len(batch) for batch in uploads] == [2, 2, 1]
+
+    def test_max_bytes(self, uploads):
+        """ Batches are cut before they go over max_bytes. """
+        dataset = self._dataset(max_bytes=25, max_latency=60)
+        dataset.append([dict(num=num) for num in range(4)])  # 10 bytes each
+        dataset.close()
+        assert [len(batch) for batch in uploads] == [2, 2]
+
+    def test_max_latency(self, uploads):
+        """ A partial batch is sent once max_latency has passed. """
+        dataset = self._dataset(max_latency=0.01)
+        dataset.append([dict(num=1)])
+        dataset._thread.join(0.5)
+        assert uploads == [[dict(num=1)]]
+        dataset.close()
+
+    def test_dropped_when_full(self, monkeypatch):
+        """ Records are dropped rather than blocking when the queue is full. """
+        release = threading.Event()
+        monkeypatch.setattr(BufferedDataset, '_upload', lambda self, data, append: release.wait())
+        dataset = self._dataset(max_records=1, max_queued=1)
+        dataset.append([dict(num=1)])
+        while not dataset._queue.empty():  # wait until the worker is stuck uploading
+            time.sleep(0.001)
+
+        dataset.append([dict(num=2), dict(num=3), dict(num=4)])
+        release.set()
+        dataset.close()
+        assert dataset.dropped_count == 2
+        assert dataset.flushed_count == 2
+
+    def test_append_after_close(self, uploads):
+        """ Appending to a closed dataset is an error. """
+        dataset = self._dataset()
+        dataset.close()
+        with pytest.raises(RuntimeError):
+            dataset.append([dict(num=1)])
+
+    def test_failed_batches_are_counted(self, monkeypatch):
+        """ Upload errors do not propagate to the caller. """
+        def failing_upload(self, data, append):
+            raise ValueError("nope")
+
+        monkeypatch.setattr(BufferedDataset, '_upload', failing_upload)
+        dataset = self._dataset()
+        dataset.append([dict(num=1), dict(num=2)])
+        dataset.close()
+        assert dataset.failed_count == 2
+        assert dataset.flushed_count == 0
+        assert isinstance(dataset.last_error, ValueError)
+
+    def test_queued_records_go_before_other_changes(self, api_key):
+        """ Records appended before an overwrite or clear are not sent after it. """
+        with FakeGeckoboard() as server:
+            server.create_dataset('test.buffered', dict(fields=dict(num=dict(type='number'))))
+            dataset = server.dataset_class(BufferedDataset)('test.buffered', api_key=api_key, max_latency=60)
+            dataset.append([dict(num=1)])
+            dataset.overwrite([dict(num=2)])
+            assert server.datasets['test.buffered']['data'] == [dict(num=2)]
+
+            dataset.append([dict(num=3)])
+            dataset.clear()
+            dataset.close()
+            assert server.datasets['test.buffered']['data'] == []
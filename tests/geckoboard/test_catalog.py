@@ -0,0 +1,66 @@
+import pytest
+
+from common.geckoboard.catalog import SchemaCatalog
+
+
+class FakeFetch:
+    """ Returns a listing of schemas and counts how often it was called. """
+
+    def __init__(self, *ids):
+        self.ids = list(ids)
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        return [dict(id=id_, fields={}) for id_ in self.ids]
+
+
+class TestSchemaCatalog:
+    """ Test the SchemaCatalog. """
+
+    @pytest.fixture
+    def fetch(self):
+        return FakeFetch('one', 'two')
+
+    def test_get_fetches_once(self, fetch):
+        """ Repeated lookups are served from the cache. """
+        catalog = SchemaCatalog(fetch)
+        assert catalog.get('one') == dict(id='one', fields={})
+        assert catalog.get('two')['id'] == 'two'
+        assert catalog.get('three') is None
+        assert fetch.calls == 1
+
+    def test_ttl(self, fetch):
+        """ A stale listing is fetched again. """
+        catalog = SchemaCatalog(fetch, ttl=0)
+        catalog.get('one')
+        catalog.get('one')
+        assert fetch.calls == 2
+
+    def test_refresh(self, fetch):
+        catalog = SchemaCatalog(fetch)
+        catalog.get('one')
+        catalog.get('one', refresh=True)
+        assert fetch.calls == 2
+
+    def test_store_and_discard(self, fetch):
+        """ Local changes are visible without another fetch. """
+        catalog = SchemaCatalog(fetch)
+        catalog.schemas()
+        catalog.store(dict(id='three', fields={}))
+        catalog.discard('one')
+        assert [schema['id'] for schema in catalog.schemas()] == ['two', 'three']
+        assert fetch.calls == 1
+
+    def test_invalidate(self, fetch):
+        catalog = SchemaCatalog(fetch)
+        catalog.get('one')
+        catalog.invalidate()
+        catalog.get('one')
+        assert fetch.calls == 2
+
+    def test_returns_copies(self, fetch):
+        """ Modifying a returned schema does not change the cache. """
+        catalog = SchemaCatalog(fetch)
+        catalog.get('one').pop('fields')
+        assert catalog.get('one') == dict(id='one', fields={})
@@ -0,0 +1,46 @@
+from datetime import date
+from datetime import datetime
+
+import pytest
+
+from common.geckoboard.columns import column_to_values
+from common.geckoboard.columns import columns_to_rows
+
+
+class TestColumnToValues:
+    """ Test column_to_values. """
+
+    def test_plain_sequence(self):
+        assert column_to_values((1, 2.5, None)) == [1, 2.5, None]
+
+    def test_dates(self):
+        column = [date(2020, 1, 2), datetime(2020, 1, 2, 3, 4), None]
+        assert column_to_values(column) == ['2020-01-02', '2020-01-02T03:04:00', None]
+
+    def test_numpy(self):
+        np = pytest.importorskip('numpy')
+        values = column_to_values(np.array([1, 2], dtype=np.int64))
+        assert values == [1, 2]
+        assert type(values[0]) is int
+
+    def test_numpy_datetime64(self):
+        np = pytest.importorskip('numpy')
+        column = np.array(['2020-01-02T03:04:05.250', 'NaT'], dtype='datetime64[ms]')
+        assert column_to_values(column) == ['2020-01-02T03:04:05', None]
+
+    def test_numpy_date64(self):
+        np = pytest.importorskip('numpy')
+        column = np.array(['2020-01-02', '2020-01-03'], dtype='datetime64[D]')
+        assert column_to_values(column) == ['2020-01-02', '2020-01-03']
+
+
+class TestColumnsToRows:
+    """ Test columns_to_rows. """
+
+    def test_basic(self):
+        rows = columns_to_rows(dict(tpl=['13', '14'], day=[date(2020, 1, 2), date(2020, 1, 3)]))
+        assert list(rows) == [dict(tpl='13', day='2020-01-02'), dict(tpl='14', day='2020-01-03')]
+
+    def test_uneven_columns(self):
+        with pytest.raises(ValueError):
+            columns_to_rows(dict(tpl=['13', '14'], num=[1]))
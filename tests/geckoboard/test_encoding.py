@@ -0,0 +1,55 @@
+import gzip
+import json
+import tempfile
+from datetime import date
+from datetime import datetime
+
+import requests
+
+from common.geckoboard import encoding
+
+
+class TestEncodePayload:
+    """ Test encode_payload. """
+
+    def test_basic(self):
+        """ Dates are converted and the rows are wrapped in a data key. """
+        rows = [dict(day=date(2020, 1, 2), num=1), dict(timestamp=datetime(2020, 1, 2, 3, 4), num=2)]
+        body = encoding.encode_payload(rows)
+        assert json.loads(body.read()) == {
+            'data': [dict(day='2020-01-02', num=1), dict(timestamp='2020-01-02T03:04:00', num=2)]
+        }
+
+    def test_empty(self):
+        assert json.loads(encoding.encode_payload([]).read()) == {'data': []}
+
+    def test_generator_spills_to_disk(self, monkeypatch):
+        """ Large payloads are streamed in chunks and not held in memory. """
+        monkeypatch.setattr(encoding, 'CHUNK_SIZE', 100)
+        body = encoding.encode_payload((dict(num=num) for num in range(1000)), spool_size=1000)
+        assert body._rolled
+        assert json.loads(body.read())['data'][-1] == dict(num=999)
+
+
+class TestCompressPayload:
+    """ Test compress_payload. """
+
+    def test_roundtrip(self):
+        rows = [dict(num=num) for num in range(100)]
+        body = encoding.compress_payload(encoding.encode_payload(rows))
+        assert json.loads(gzip.decompress(body.read())) == {'data': rows}
+
+
+class TestUploadBody:
+    """ Test UploadBody. """
+
+    def test_stays_in_memory(self, monkeypatch):
+        """ requests sizes the body with len() rather than rolling the spool over to disk. """
+        rollovers = []
+        monkeypatch.setattr(tempfile.SpooledTemporaryFile, 'rollover', lambda self: rollovers.append(self))
+        payload = encoding.encode_payload([dict(num=1)])
+        request = requests.Request('POST', 'http://localhost/', data=encoding.UploadBody(payload)).prepare()
+
+        assert request.headers['Content-Length'] == str(len(b'{"data":[{"num":1}]}'))
+        assert rollovers == []
+        assert b''.join(request.body) == b'{"data":[{"num":1}]}'
@@ -0,0 +1,156 @@
+import http.client
+
+import pytest
+
+from benchmarks.geckoboard_loadtest import run_load_test
+from common.geckoboard import ResponseError
+from common.geckoboard.fake_server import FakeGeckoboard
+from tests.test_geckoboard import SimpleSchema
+from tests.test_geckoboard import TEST_SCHEMA_DATA
+
+
+class TestFakeGeckoboard:
+    """ Test Dataset against the FakeGeckoboard. """
+    DATASET_ID = 'fake.dataset'
+    ROWS = [dict(num_orders=8, timestamp='2020-01-02T00:00:00', tpl='mytpl')]
+
+    @pytest.fixture
+    def server(self):
+        with FakeGeckoboard() as server:
+            yield server
+
+    @pytest.fixture
+    def dataset(self, server, api_key):
+        return server.dataset_class()(self.DATASET_ID, api_key=api_key)
+
+    def test_schema_roundtrip(self, server, dataset):
+        dataset.create_schema(SimpleSchema)
+        schema = dataset.get_schema(refresh=True)
+        assert schema['unique_by'] == ['timestamp']
+        assert schema['fields']['num_orders'] == dict(type='number', optional=False, name='Number of Orders')
+
+        dataset.delete()
+        assert dataset.get_schema(refresh=True) is None
+
+    def test_ensure_schema(self, server, dataset, monkeypatch):
+        """ The schema is only put in place when it is missing or different. """
+        assert dataset.ensure_schema(SimpleSchema)
+        num_requests = len(server.requests)
+        assert not dataset.ensure_schema(SimpleSchema)
+        assert len(server.requests) == num_requests
+
+        # as if in a new process, the catalog is checked instead
+        monkeypatch.setattr(type(dataset), '_schema_fingerprints', {})
+        dataset._get_catalog(dataset._key_from_auth_params()).invalidate()
+        assert not dataset.ensure_schema(SimpleSchema)
+        assert [request.method for request in server.requests[num_requests:]] == ['GET']
+
+        dataset.delete()
+        assert dataset.ensure_schema(TEST_SCHEMA_DATA)
+
+    def test_append_and_overwrite(self, server, dataset):
+        dataset.create_schema(TEST_SCHEMA_DATA)
+        dataset.append(self.ROWS)
+        dataset.append([dict(num_orders=9, timestamp='2020-01-02T00:00:00', tpl='mytpl')])
+        assert server.datasets[self.DATASET_ID]['data'] == [dict(self.ROWS[0], num_orders=9)]
+
+        dataset.overwrite([])
+        assert server.datasets[self.DATASET_ID]['data'] == []
+
+    def test_sync_after_recreate(self, server, dataset, tmp_path):
+        """ Recreating the dataset drops the sync snapshot, so the rows are sent again. """
+        dataset.create_schema(TEST_SCHEMA_DATA)
+        dataset.sync(self.ROWS, unique_by=['timestamp'], snapshot_dir=str(tmp_path))
+        dataset.delete()
+        dataset.create_schema(TEST_SCHEMA_DATA)
+
+        stats = dataset.sync(self.ROWS, unique_by=['timestamp'], snapshot_dir=str(tmp_path))
+        assert stats['overwritten']
+        assert server.datasets[self.DATASET_ID]['data'] == self.ROWS
+
+    def test_catalog_per_server(self, server, dataset, api_key):
+        """ Datasets with the same api key against another server don't share its schema listing. """
+        dataset.create_schema(TEST_SCHEMA_DATA)
+        assert dataset.get_schema() is not None
+        with FakeGeckoboard() as other_server:
+            other = other_server.dataset_class()(self.DATASET_ID, api_key=api_key)
+            assert other.get_schema() is None
+
+    def test_ensure_schema_per_server(self, server, dataset, api_key):
+        """ A schema put in place on one server is still put in place on another. """
+        assert dataset.ensure_schema(SimpleSchema)
+        with FakeGeckoboard() as other_server:
+            other = other_server.dataset_class()(self.DATASET_ID, api_key=api_key)
+            assert other.ensure_schema(SimpleSchema)
+            assert self.DATASET_ID in other_server.datasets
+
+    def test_columnar_upload(self, server, dataset):
+        dataset.create_schema(TEST_SCHEMA_DATA)
+        dataset.overwrite(dict(num_orders=[8], timestamp=['2020-01-02T00:00:00'], tpl=['mytpl']))
+        assert server.datasets[self.DATASET_ID]['data'] == self.ROWS
+
+    def test_compressed_upload(self, server, api_key):
+        dataset = server.dataset_class()(self.DATASET_ID, api_key=api_key, compress=True)
+        dataset.create_schema(TEST_SCHEMA_DATA)
+        dataset.append(self.ROWS)
+        assert server.datasets[self.DATASET_ID]['data'] == self.ROWS
+
+    def test_compressed_bytes_are_recorded(self, server, api_key):
+        """ Requests are recorded at the size they were sent, not once decompressed. """
+        rows = [dict(self.ROWS[0], timestamp=f'2020-01-02T{num // 60:02}:{num % 60:02}:00') for num in range(200)]
+        for compress in [False, True]:
+            dataset = server.dataset_class()(self.DATASET_ID, api_key=api_key, compress=compress)
+            dataset.create_schema(TEST_SCHEMA_DATA)
+            dataset.overwrite(rows)
+        plain, compressed = [request.num_bytes for request in server.requests if request.path.endswith('/data')]
+        assert compressed < plain / 10
+
+    def test_missing_dataset(self, dataset):
+        with pytest.raises(ResponseError) as excinfo:
+            dataset.append(self.ROWS)
+        assert excinfo.value.response.status_code == 404
+
+    def test_stop_ends_connections(self):
+        """ Handler threads waiting on keep-alive connections are stopped along with the server. """
+        with FakeGeckoboard() as server:
+            connection = http.client.HTTPConnection(*server._httpd.server_address[:2])
+            connection.request('GET', '/datasets')
+            assert connection.getresponse().read()
+            threads = list(server._httpd._handlers)
+            assert threads
+        assert not any(thread.is_alive() for thread in threads)
+        connection.close()
+
+    def test_record_limits(self, dataset, api_key):
+        with FakeGeckoboard(max_records_per_request=1) as server:
+            dataset = server.dataset_class()(self.DATASET_ID, api_key=api_key)
+            dataset.create_schema(TEST_SCHEMA_DATA)
+            with pytest.raises(ResponseError):
+                dataset.append(self.ROWS + [dict(self.ROWS[0], timestamp='2020-01-03T00:00:00')])
+
+    def test_api_key(self, api_key):
+        with FakeGeckoboard(api_key='right') as server:
+            with pytest.raises(ResponseError) as excinfo:
+                server.dataset_class()(self.DATASET_ID, api_key=api_key).create_schema(TEST_SCHEMA_DATA)
+        assert excinfo.value.response.status_code == 401
+
+    def test_throttled_requests_are_retried(self, api_key):
+        with FakeGeckoboard(throttle_every=2) as server:
+            dataset = server.dataset_class()(self.DATASET_ID, api_key=api_key)
+            dataset.create_schema(TEST_SCHEMA_DATA)
+            dataset.append(self.ROWS)
+            assert [request.status for request in server.requests] == [201, 429, 200]
+        assert server.datasets[self.DATASET_ID]['data'] == self.ROWS
+
+
+class TestLoadTest:
+    """ A small load test, as a regression gate for the client. """
+
+    def test_all_rows_arrive(self):
+        report = run_load_test(num_rows=5000, batch_size=500, concurrency=4, throttle_every=5)
+        assert report.rows_received == 5000
+        assert report.requests == 10 + report.retries
+        assert report.retries > 0
+        assert report.bytes_sent > 0
+        assert 0 < report.p50_latency <= report.p99_latency
+        assert 'requests' in str(report)
@@ -0,0 +1,81 @@
+from datetime import datetime
+from datetime import timedelta
+
+import pytest
+import pytz
+
+from common.geckoboard import Types
+from common.geckoboard.rollups import Rollup
+
+
+class FakeDataset:
+    """ Collects appended rows. """
+    MAX_APPEND_RECORDS = 500
+
+    def __init__(self):
+        self.appended = []
+
+    def append(self, data):
+        self.appended.extend(data)
+
+
+def _event(minute, second=0, tpl='a', amount=1):
+    return dict(shipped_at=datetime(2020, 1, 2, 3, minute, second), tpl=tpl, amount=amount)
+
+
+class TestRollup:
+    """ Test the Rollup. """
+
+    def setup_method(self):
+        self.dataset = FakeDataset()
+        self.rollup = Rollup(
+            self.dataset,
+            time_field='shipped_at',
+            group_by=['tpl'],
+            aggregates=dict(count=('count', None), total=('sum', 'amount'), biggest=('max', 'amount')),
+        )
+
+    def test_buckets(self):
+        """ Events are counted per minute and tpl. """
+        self.rollup.add([_event(4, 1), _event(4, 59, amount=5), _event(4, 30, tpl='b'), _event(5)])
+        assert self.rollup.flush() == 3
+
+        start = datetime(2020, 1, 2, 3, 4, tzinfo=pytz.utc)
+        assert self.dataset.appended == [
+            dict(shipped_at=start, tpl='a', count=2, total=6, biggest=5),
+            dict(shipped_at=start, tpl='b', count=1, total=1, biggest=1),
+            dict(shipped_at=start + timedelta(minutes=1), tpl='a', count=1, total=1, biggest=1),
+        ]
+
+    def test_only_changed_buckets_are_flushed(self):
+        """ A late event re-sends its (updated) bucket only. """
+        self.rollup.add([_event(4), _event(5)])
+        self.rollup.flush()
+        self.rollup.add([_event(4, 10, amount=2)])
+        assert self.rollup.flush() == 1
+        assert self.dataset.appended[-1]['count'] == 2
+        assert self.dataset.appended[-1]['total'] == 3
+        assert self.rollup.flush() == 0
+
+    def test_events_past_retention_are_dropped(self):
+        rollup = Rollup(self.dataset, time_field='shipped_at', retention=timedelta(minutes=10))
+        rollup.add([_event(30), _event(4)])
+        assert rollup.late_dropped == 1
+        rollup.flush()
+        assert len(rollup._buckets) == 1
+
+    def test_timezone(self):
+        """ Hour buckets are aligned to the wall clock of the timezone. """
+        rollup = Rollup(self.dataset, time_field='at', granularity=timedelta(hours=1), timezone='Asia/Kolkata')
+        start = rollup.bucket_start(datetime(2020, 1, 2, 3, 4, tzinfo=pytz.utc))
+        assert start.isoformat() == '2020-01-02T08:00:00+05:30'
+
+    def test_schema(self):
+        schema = self.rollup.schema()
+        assert schema['shipped_at'].type == Types.DATETIME
+        assert [name for name, field in schema.items() if field.unique] == ['shipped_at', 'tpl']
+        assert schema['total'].type == Types.NUMBER
+
+    def test_unknown_aggregate(self):
+        with pytest.raises(ValueError):
+            Rollup(self.dataset, time_field='at', aggregates=dict(middle=('median', 'amount')))
@@ -0,0 +1,99 @@
+from types import SimpleNamespace
+
+from common.geckoboard.scheduler import RequestScheduler
+from common.geckoboard.scheduler import TokenBucket
+from common.geckoboard.scheduler import parse_retry_after
+
+
+def _response(status_code, **headers):
+    return SimpleNamespace(status_code=status_code, headers=headers)
+
+
+class FakeSender:
+    """ Returns the given responses in order and counts calls. """
+
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        return self.responses.pop(0)
+
+
+class TestTokenBucket:
+    """ Test the TokenBucket. """
+
+    def test_burst_does_not_wait(self):
+        bucket = TokenBucket(rate=1, capacity=3)
+        assert [bucket.acquire() < 0.01 for _ in range(3)] == [True] * 3
+
+    def test_waits_for_refill(self):
+        """ Once empty, callers wait for the next token. """
+        bucket = TokenBucket(rate=100, capacity=1)
+        bucket.acquire()
+        assert bucket.acquire() > 0.005
+
+    def test_pause(self):
+        bucket = TokenBucket(rate=1000, capacity=10)
+        bucket.pause(0.02)
+        assert bucket.acquire() >= 0.02
+
+
+class TestParseRetryAfter:
+    """ Test parse_retry_after. """
+
+    def test_seconds(self):
+        assert parse_retry_after('3') == 3.0
+
+    def test_http_date_in_the_past(self):
+        assert parse_retry_after('Wed, 21 Oct 2015 07:28:00 GMT') == 0.0
+
+    def test_missing_or_garbage(self):
+        assert parse_retry_after(None) is None
+        assert parse_retry_after('soon') is None
+
+
+class TestRequestScheduler:
+    """ Test the RequestScheduler. """
+
+    def _scheduler(self, **kwargs):
+        return RequestScheduler(**dict(dict(rate=1000, burst=10, backoff=0.001), **kwargs))
+
+    def test_ok_response(self):
+        scheduler = self._scheduler()
+        send = FakeSender(_response(200))
+        assert scheduler.call(send).status_code == 200
+        assert scheduler.stats.requests == 1
+        assert scheduler.stats.retries == 0
+
+    def test_retries_throttled_and_server_errors(self):
+        """ 429 and 5xx responses are retried until one is ok. """
+        scheduler = self._scheduler()
+        send = FakeSender(_response(429, **{'Retry-After': '0'}), _response(503), _response(201))
+        assert scheduler.call(send).status_code == 201
+        assert send.calls == 3
+        assert scheduler.stats.retries == 2
+        assert scheduler.stats.throttled == 1
+
+    def test_client_errors_are_not_retried(self):
+        scheduler = self._scheduler()
+        send = FakeSender(_response(400), _response(200))
+        assert scheduler.call(send).status_code == 400
+        assert send.calls == 1
+
+    def test_gives_up_after_max_retries(self):
+        scheduler = self._scheduler(max_retries=2)
+        send = FakeSender(*[_response(500)] * 4)
+        assert scheduler.call(send).status_code == 500
+        assert send.calls == 3
+
+    def test_max_retries_per_call(self):
+        scheduler = self._scheduler(max_retries=2)
+        send = FakeSender(*[_response(500)] * 4)
+        assert scheduler.call(send, max_retries=0).status_code == 500
+        assert send.calls == 1
+
+    def test_shared_per_api_key(self):
+        assert RequestScheduler.for_api_key('one') is RequestScheduler.for_api_key('one')
+        assert RequestScheduler.for_api_key('one') is not RequestScheduler.for_api_key('two')
@@ -0,0 +1,170 @@
+import json
+import os
+
+import pytest
+
+from common.geckoboard import ResponseError
+from common.geckoboard.fake_server import FakeGeckoboard
+from common.geckoboard.spool import DeadLetterSpool
+from common.geckoboard.spool import SpoolReplayer
+
+
+@pytest.fixture
+def spool(tmp_path):
+    return DeadLetterSpool(str(tmp_path / 'spool'))
+
+
+class TestDeadLetterSpool:
+    """ Test the DeadLetterSpool. """
+
+    def test_commit_and_compact(self, spool):
+        spool.put('one', [dict(num=1)])
+        spool.put('two', [dict(num=2)], append=False)
+        entries = list(spool.pending())
+        assert [entry for _, entry in entries] == [
+            dict(dataset_id='one', append=True, payload=dict(data=[dict(num=1)])),
+            dict(dataset_id='two', append=False, payload=dict(data=[dict(num=2)])),
+        ]
+
+        spool.commit(entries[0][0])
+        assert len(spool) == 1
+        spool.compact()
+        assert len(spool) == 1
+
+        spool.commit(entries[1][0])
+        spool.compact()
+        assert len(spool) == 0
+        assert os.path.getsize(spool.path) == 0
+        assert spool.committed_offset() == 0
+
+    def test_holds(self, spool):
+        spool.put('one.two', [dict(num=1)])
+        assert spool.holds('one.two')
+        assert not spool.holds('one')
+        spool.commit(next(spool.pending())[0])
+        assert not spool.holds('one.two')
+
+    def test_partial_line_is_not_pending(self, spool):
+        """ A write that has not finished is left for a later pass. """
+        spool.put('one', [dict(num=1)])
+        with open(spool.path, 'ab') as spool_file:
+            spool_file.write(b'{"dataset_id": "two"')
+        assert len(spool) == 1
+
+
+class TestSpooledDataset:
+    """ Test spooling failed uploads and replaying them against the FakeGeckoboard. """
+    DATASET_ID = 'spooled.dataset'
+
+    @pytest.fixture
+    def server(self):
+        with FakeGeckoboard(throttle_every=1) as server:
+            server.create_dataset(self.DATASET_ID, dict(fields=dict(num=dict(type='number'))))
+            yield server
+
+    @pytest.mark.parametrize('compress', [False, True])
+    def test_unavailable_uploads_are_spooled(self, server, api_key, spool, compress):
+        dataset = server.dataset_class()(self.DATASET_ID, api_key=api_key, compress=compress, spool=spool)
+        dataset.append([dict(num=1)])
+        dataset.overwrite([dict(num=2)])
+
+        assert dataset.spooled_count == 2
+        # spooled on the first failure rather than after the scheduler's retries, and
+        # the overwrite is spooled behind the append without being tried
+        assert len(server.requests) == 1
+        assert [entry for _, entry in spool.pending()] == [
+            dict(dataset_id=self.DATASET_ID, append=True, payload=dict(data=[dict(num=1)])),
+            dict(dataset_id=self.DATASET_ID, append=False, payload=dict(data=[dict(num=2)])),
+        ]
+
+    def test_uploads_queue_behind_spooled_ones(self, server, api_key, spool):
+        """ A later overwrite isn't sent ahead of (and then replaced by) an older spooled one. """
+        dataset = server.dataset_class()(self.DATASET_ID, api_key=api_key, spool=spool)
+        dataset.overwrite([dict(num=1)])
+        server.throttle_every = 0
+        num_requests = len(server.requests)
+        dataset.overwrite([dict(num=2)])
+        assert dataset.spooled_count == 2
+        assert len(server.requests) == num_requests
+
+        replayer = SpoolReplayer(spool, api_key=api_key, dataset_class=server.dataset_class())
+        assert replayer.replay()
+        assert server.datasets[self.DATASET_ID]['data'] == [dict(num=2)]
+
+        dataset.overwrite([dict(num=3)])
+        assert dataset.spooled_count == 2
+        assert server.datasets[self.DATASET_ID]['data'] == [dict(num=3)]
+
+    def test_timeouts_are_spooled(self, server, api_key, spool):
+        """ A server that doesn't answer in time doesn't hold up the upload. """
+        server.throttle_every = 0
+        server.latency = 0.5
+        LocalDataset = server.dataset_class()
+        LocalDataset.TIMEOUT = (1, 0.05)
+        dataset = LocalDataset(self.DATASET_ID, api_key=api_key, spool=spool)
+        dataset.append([dict(num=1)])
+        assert dataset.spooled_count == 1
+
+    def test_rejected_uploads_are_raised(self, server, api_key, spool):
+        server.throttle_every = 0
+        server.max_records_per_request = 1
+        dataset = server.dataset_class()(self.DATASET_ID, api_key=api_key, spool=spool)
+        with pytest.raises(ResponseError):
+            dataset.append([dict(num=1), dict(num=2)])
+        assert len(spool) == 0
+
+    def test_replay(self, server, api_key, spool):
+        """ Consecutive appends are sent together, and nothing is committed until it is sent. """
+        dataset = server.dataset_class()(self.DATASET_ID, api_key=api_key, spool=spool)
+        for num in range(3):
+            dataset.append([dict(num=num)])
+        replayer = SpoolReplayer(spool, api_key=api_key, dataset_class=server.dataset_class())
+
+        assert not replayer.replay()
+        assert isinstance(replayer.last_error, ResponseError)
+        assert len(spool) == 3
+
+        server.throttle_every = 0
+        num_requests = len(server.requests)
+        assert replayer.replay()
+        assert len(server.requests) == num_requests + 1
+        assert server.datasets[self.DATASET_ID]['data'] == [dict(num=0), dict(num=1), dict(num=2)]
+        assert replayer.replayed_count == 3
+        assert os.path.getsize(spool.path) == 0
+
+    def test_replay_batches(self, server, api_key, spool):
+        """ Batches keep to max_records, and overwrites are never merged. """
+        server.throttle_every = 0
+        spool.put(self.DATASET_ID, [dict(num=1)])
+        spool.put(self.DATASET_ID, [dict(num=2)])
+        spool.put(self.DATASET_ID, [dict(num=3)])
+        spool.put(self.DATASET_ID, [dict(num=4)], append=False)
+        spool.put(self.DATASET_ID, [dict(num=5)], append=False)
+        replayer = SpoolReplayer(spool, api_key=api_key, dataset_class=server.dataset_class(), max_records=2)
+        assert [(append, batch.records) for _, append, batch, _ in replayer._batches()] == [
+            (True, [dict(num=1), dict(num=2)]),
+            (True, [dict(num=3)]),
+            (False, [dict(num=4)]),
+            (False, [dict(num=5)]),
+        ]
+        assert replayer.replay()
+        assert server.datasets[self.DATASET_ID]['data'] == [dict(num=5)]
+
+    def test_rejected_batches_are_set_aside(self, server, api_key, spool):
+        """ A batch geckoboard refuses doesn't hold up the ones behind it. """
+        server.throttle_every = 0
+        spool.put('deleted.dataset', [dict(num=1)])
+        spool.put(self.DATASET_ID, [dict(num=2)])
+        replayer = SpoolReplayer(spool, api_key=api_key, dataset_class=server.dataset_class())
+
+        assert replayer.replay()
+        assert replayer.replayed_count == 1
+        assert replayer.rejected_count == 1
+        assert server.datasets[self.DATASET_ID]['data'] == [dict(num=2)]
+        assert len(spool) == 0
+        with open(spool.rejected_path) as rejected_file:
+            rejected = [json.loads(line) for line in rejected_file]
+        assert [(entry['dataset_id'], entry['payload']) for entry in rejected] == [
+            ('deleted.dataset', dict(data=[dict(num=1)])),
+        ]
+        assert rejected[0]['error'].startswith('404 ')
@@ -0,0 +1,91 @@
+import pytest
+
+from common.geckoboard import Dataset
+
+
+@pytest.fixture
+def uploads(monkeypatch):
+    """ Captures (append, data) for every upload. """
+    calls = []
+
+    def fake_upload(self, data, append):
+        calls.append((append, list(data)))
+
+    monkeypatch.setattr(Dataset, '_upload', fake_upload)
+    return calls
+
+
+class TestSync:
+    """ Test Dataset.sync. """
+    RECORDS = [dict(tpl='a', num=1), dict(tpl='b', num=2), dict(tpl='c', num=3)]
+
+    def setup_method(self):
+        self.dataset = Dataset('test.sync', api_key='XXXXXXX')
+
+    def _sync(self, records, tmp_path, unique_by=('tpl',)):
+        return self.dataset.sync(records, unique_by=list(unique_by), snapshot_dir=str(tmp_path))
+
+    def test_first_sync_overwrites(self, uploads, tmp_path):
+        """ Without a snapshot the whole dataset is overwritten. """
+        stats = self._sync(self.RECORDS, tmp_path)
+        assert uploads == [(False, self.RECORDS)]
+        assert stats == dict(inserted=3, changed=0, deleted=0, overwritten=True)
+
+    def test_only_changes_are_appended(self, uploads, tmp_path):
+        """ New and changed rows are appended, unchanged ones are skipped. """
+        self._sync(self.RECORDS, tmp_path)
+        records = [dict(tpl='a', num=1), dict(tpl='b', num=20), dict(tpl='c', num=3), dict(tpl='d', num=4)]
+        stats = self._sync(records, tmp_path)
+
+        assert uploads[1:] == [(True, [dict(tpl='b', num=20), dict(tpl='d', num=4)])]
+        assert stats == dict(inserted=1, changed=1, deleted=0, overwritten=False)
+
+    def test_no_changes(self, uploads, tmp_path):
+        """ Nothing is sent when nothing changed. """
+        self._sync(self.RECORDS, tmp_path)
+        self._sync(self.RECORDS, tmp_path)
+        assert len(uploads) == 1
+
+    def test_deletions_overwrite(self, uploads, tmp_path):
+        """ Removing a row falls back to overwrite. """
+        self._sync(self.RECORDS, tmp_path)
+        stats = self._sync(self.RECORDS[:2], tmp_path)
+        assert uploads[1:] == [(False, self.RECORDS[:2])]
+        assert stats['deleted'] == 1
+        assert stats['overwritten']
+
+    def test_no_unique_by_overwrites(self, uploads, tmp_path):
+        """ Without unique_by there is no way to append changes. """
+        self._sync(self.RECORDS, tmp_path, unique_by=())
+        self._sync(self.RECORDS, tmp_path, unique_by=())
+        assert [append for append, _ in uploads] == [False, False]
+        assert not list(tmp_path.iterdir())
+
+    def test_duplicate_keys(self, uploads, tmp_path):
+        """ Rows sharing unique_by values can't be told apart, so nothing is sent. """
+        with pytest.raises(ValueError):
+            self._sync([dict(tpl='a', num=1), dict(tpl='a', num=2)], tmp_path)
+        assert uploads == []
+
+    def test_clear_drops_snapshot(self, uploads, tmp_path):
+        """ Changing the data outside sync means the next sync overwrites. """
+        self._sync(self.RECORDS, tmp_path)
+        self.dataset.clear()
+        stats = self._sync(self.RECORDS, tmp_path)
+        assert uploads[-1] == (False, self.RECORDS)
+        assert stats['overwritten']
+
+    def test_append_drops_snapshot(self, uploads, tmp_path):
+        """ A row appended outside sync is removed by the next sync that leaves it out. """
+        self._sync(self.RECORDS, tmp_path)
+        self.dataset.append([dict(tpl='z', num=26)])
+        stats = self._sync(self.RECORDS, tmp_path)
+        assert uploads[-1] == (False, self.RECORDS)
+        assert stats['overwritten']
+
+    def test_snapshot_per_api_key(self, uploads, tmp_path):
+        """ The same dataset id under another api key has its own snapshot. """
+        self._sync(self.RECORDS, tmp_path)
+        other = Dataset('test.sync', api_key='YYYYYYY')
+        stats = other.sync(self.RECORDS, unique_by=['tpl'], snapshot_dir=str(tmp_path))
+        assert stats['overwritten']
@@ -0,0 +1,85 @@
+from datetime import date
+from datetime import datetime
+
+import pytest
+
+from common.geckoboard import Dataset
+from common.geckoboard import Field
+from common.geckoboard import Types
+from common.geckoboard.validation import RowError
+from common.geckoboard.validation import ValidationError
+from common.geckoboard.validation import compile_validator
+from common.geckoboard.validation import get_validator
+
+FIELDS = dict(
+    day=Field(Types.DATE, required=True, unique=True),
+    tpl=Field(Types.STRING, unique=True),
+    amount=Field(Types.MONEY),
+    updated=Field(Types.DATETIME),
+)
+
+
+class TestCompileValidator:
+    """ Test compile_validator. """
+
+    def setup_method(self):
+        self.validate = compile_validator(FIELDS)
+
+    def test_coerces_good_rows(self):
+        rows = [
+            dict(day=date(2020, 1, 2), tpl=13, amount='1.5', updated=datetime(2020, 1, 2, 3, 4)),
+            dict(day='2020-01-02', tpl='14', amount=None),
+        ]
+        assert list(self.validate(rows)) == [
+            dict(day='2020-01-02', tpl='13', amount=1.5, updated='2020-01-02T03:04:00'),
+            dict(day='2020-01-02', tpl='14', amount=None),
+        ]
+
+    def test_reports_bad_rows_by_index(self):
+        """ Every problem is reported, and only after all rows were checked. """
+        rows = [
+            dict(day='2020-01-02', tpl='13'),
+            dict(tpl='14', amount='lots'),
+            dict(day='2020-01-02', tpl='13', color='red'),
+            dict(day='2020-01-02', tpl='15', amount=True),
+        ]
+        validated = self.validate(rows)
+        assert next(validated) == dict(day='2020-01-02', tpl='13')
+        with pytest.raises(ValidationError) as excinfo:
+            list(validated)
+        assert excinfo.value.errors == [
+            RowError(1, 'amount', "could not convert string to float: 'lots'"),
+            RowError(1, 'day', "is required"),
+            RowError(2, 'color', "is not a field of the dataset"),
+            RowError(3, 'amount', "expected a number, got True"),
+        ]
+
+    def test_duplicate_unique_by(self):
+        rows = [dict(day='2020-01-02', tpl='13'), dict(day='2020-01-02', tpl='13')]
+        with pytest.raises(ValidationError) as excinfo:
+            list(self.validate(rows))
+        assert [(error.index, error.field) for error in excinfo.value.errors] == [(1, 'day,tpl')]
+
+    def test_cached_per_schema(self):
+        assert get_validator(FIELDS) is get_validator(dict(FIELDS))
+
+
+class TestDatasetValidation:
+    """ Test validation through the Dataset. """
+
+    def test_validate(self):
+        dataset = Dataset('test.validation', api_key='XXXXXXX', schema=FIELDS)
+        assert dataset.validate(dict(day=['2020-01-02'], tpl=['13'])) == [dict(day='2020-01-02', tpl='13')]
+
+    def test_validate_without_schema(self):
+        with pytest.raises(ValueError):
+            Dataset('test.validation', api_key='XXXXXXX').validate([])
+
+    def test_bad_rows_are_not_uploaded(self, monkeypatch):
+        """ Nothing is sent if any row is bad. """
+        requests = []
+        monkeypatch.setattr(Dataset, '_request', classmethod(lambda cls, *args, **kwargs: requests.append(args)))
+        dataset = Dataset('test.validation', api_key='XXXXXXX', schema=FIELDS)
+        with pytest.raises(ValidationError):
+            dataset.append([dict(day='2020-01-02'), dict(day='tomorrow')])
+        assert requests == []
@@ -1,8 +1,17 @@
 import os
+import sys
+import threading
+from datetime import timedelta
 from importlib import import_module
+
+import pytest
 from tests import config_testfiles
 
 from common.config import Config
+from common.config import ConfigAttribute
+from common.config import LayeredConfig
+from common.config import _code_cache_path
+from common.config import lazy
 
 CONFIG_TESTFILES_DIR = "config_testfiles"
 THIS_DIR = os.path.dirname(os.path.realpath(__file__))
@@ -82,6 +91,23 @@ class TestNamespace(BasicConfigTestBase):
         my_vars = self.config.get_namespace("MY_")
         assert my_vars == {'var': 'wonderful', 'var2': 23}
 
+    def test_namespace_is_cached_until_written(self):
+        """ Repeated lookups share a read-only view, which is rebuilt after any write. """
+        self.config.from_pyfile(self.relative_path)
+        my_vars = self.config.get_namespace("MY_")
+        assert self.config.get_namespace("MY_") is my_vars
+        assert self.config.get_namespace("MY_", lowercase=False) == {'VAR': 'wonderful', 'VAR2': 23}
+        with pytest.raises(TypeError):
+            my_vars['var'] = 'changed'
+
+        self.config['MY_VAR3'] = 3
+        assert self.config.get_namespace("MY_") == {'var': 'wonderful', 'var2': 23, 'var3': 3}
+        self.config.update(MY_VAR3=4)
+        assert self.config.get_namespace("MY_")['var3'] == 4
+        del self.config['MY_VAR3']
+        self.config.from_mapping(MY_VAR='changed')
+        assert self.config.get_namespace("MY_") == {'var': 'changed', 'var2': 23}
+
 
 class TestConfigFromEnvStage(BasicConfigTestBase):
 
@@ -118,3 +144,314 @@ class TestConfigFromEnvStage(BasicConfigTestBase):
         module = import_module('tests.config_testfiles')
         config = Config.new_from_env_stage(config_testfiles)
         self._assert_dev_config(config)
+
+
+class TestCompiledCache:
+    """ Test caching the compiled code of config files. """
+
+    @pytest.fixture(autouse=True)
+    def write_bytecode(self, monkeypatch):
+        monkeypatch.setattr(sys, "dont_write_bytecode", False)
+
+    def _write(self, path, source):
+        path.write_text(source)
+        return str(path)
+
+    def test_cache_is_used_while_fresh(self, tmp_path):
+        filename = self._write(tmp_path / "stage.py", "MY_VAR = 1\n")
+        Config(config_root=str(tmp_path)).from_pyfile("stage.py")
+        cache_path = _code_cache_path(filename)
+        assert os.path.isfile(cache_path)
+
+        with open(cache_path, "rb") as cache_file:
+            data = cache_file.read()
+        stale = data.replace(b"MY_VAR", b"MY_VAX")
+        with open(cache_path, "wb") as cache_file:
+            cache_file.write(stale)
+        config = Config(config_root=str(tmp_path))
+        config.from_pyfile("stage.py")
+        assert config == dict(MY_VAX=1)
+
+    def test_changed_source_is_recompiled(self, tmp_path):
+        filename = self._write(tmp_path / "stage.py", "MY_VAR = 1\n")
+        Config(config_root=str(tmp_path)).from_pyfile(filename)
+        self._write(tmp_path / "stage.py", "MY_VAR = 22\n")
+
+        config = Config(config_root=str(tmp_path))
+        config.from_pyfile(filename)
+        assert config == dict(MY_VAR=22)
+
+    def test_corrupt_cache_is_ignored(self, tmp_path):
+        filename = self._write(tmp_path / "stage.py", "MY_VAR = 1\n")
+        Config(config_root=str(tmp_path)).from_pyfile(filename)
+        with open(_code_cache_path(filename), "r+b") as cache_file:
+            cache_file.truncate(30)
+
+        config = Config(config_root=str(tmp_path))
+        config.from_pyfile(filename)
+        assert config == dict(MY_VAR=1)
+
+    def test_dont_write_bytecode(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(sys, "dont_write_bytecode", True)
+        filename = self._write(tmp_path / "stage.py", "MY_VAR = 1\n")
+        Config(config_root=str(tmp_path)).from_pyfile(filename)
+        assert not os.path.exists(_code_cache_path(filename))
+
+
+class TestReload:
+    """ Test reloading config files when they change. """
+
+    def _write(self, path, source):
+        path.write_text(source)
+        stat = os.stat(path)
+        # make sure the change is seen even on coarse filesystem timestamps
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+
+    @pytest.fixture
+    def config(self, tmp_path):
+        self._write(tmp_path / "stage.py", "BATCH_SIZE = 100\nPOOL_SIZE = 4\nOLD = True\n")
+        config = Config(config_root=str(tmp_path))
+        config.from_pyfile("stage.py")
+        config['OTHER'] = 'kept'
+        return config
+
+    def test_reload_if_changed(self, config, tmp_path):
+        changes = []
+        config.on_change(changes.append)
+        assert config.reload_if_changed() == set()
+
+        self._write(tmp_path / "stage.py", "BATCH_SIZE = 500\nPOOL_SIZE = 4\nNEW = 1\n")
+        assert config.reload_if_changed() == {'BATCH_SIZE', 'OLD', 'NEW'}
+        assert config == dict(BATCH_SIZE=500, POOL_SIZE=4, NEW=1, OTHER='kept')
+        assert changes == [{'BATCH_SIZE', 'OLD', 'NEW'}]
+        assert config.reload_if_changed() == set()
+
+    def test_runtime_values_are_kept(self, config, tmp_path):
+        """ Only what the files changed is applied; values set since are left alone. """
+        config['BATCH_SIZE'] = 250
+        config.from_mapping(OLD=False)
+        self._write(tmp_path / "stage.py", "BATCH_SIZE = 100\nPOOL_SIZE = 8\n")
+        assert config.reload_if_changed() == {'POOL_SIZE'}
+        assert config == dict(BATCH_SIZE=250, POOL_SIZE=8, OLD=False, OTHER='kept')
+
+        self._write(tmp_path / "stage.py", "BATCH_SIZE = 500\nPOOL_SIZE = 8\n")
+        assert config.reload_if_changed() == {'BATCH_SIZE'}
+        assert config['BATCH_SIZE'] == 500
+
+    def test_unchanged_lazy_values_are_kept(self, tmp_path):
+        """ Re-running a file doesn't report (or recompute) lazy values whose source didn't change. """
+        self._write(tmp_path / "stage.py", "from common.config import lazy\nZONE = lazy(str, 'UTC')\nA = 1\n")
+        config = Config(config_root=str(tmp_path))
+        config.from_pyfile("stage.py")
+        marker = dict.__getitem__(config, 'ZONE')
+        assert config['ZONE'] == 'UTC'
+
+        self._write(tmp_path / "stage.py", "from common.config import lazy\nZONE = lazy(str, 'UTC')\nA = 2\n")
+        assert config.reload_if_changed() == {'A'}
+        assert dict.__getitem__(config, 'ZONE') is marker
+
+        self._write(tmp_path / "stage.py", "from common.config import lazy\nZONE = lazy(str, 'MST')\nA = 2\n")
+        assert config.reload_if_changed() == {'ZONE'}
+        assert config['ZONE'] == 'MST'
+
+    def test_failed_reload_keeps_config(self, config, tmp_path):
+        self._write(tmp_path / "stage.py", "BATCH_SIZE = 500\nPOOL_SIZE = 1 / 0\n")
+        with pytest.raises(ZeroDivisionError):
+            config.reload_if_changed()
+        assert config['BATCH_SIZE'] == 100
+
+    def test_watch(self, config, tmp_path):
+        changed = threading.Event()
+        config.on_change(lambda keys: changed.set())
+        config.watch(interval=0.01)
+        try:
+            self._write(tmp_path / "stage.py", "BATCH_SIZE = 500\nPOOL_SIZE = 4\nOLD = True\n")
+            assert changed.wait(5)
+        finally:
+            config.stop_watching()
+        assert config['BATCH_SIZE'] == 500
+
+
+class TestLazy:
+    """ Test lazy config values. """
+
+    def test_resolved_once_on_first_read(self):
+        calls = []
+
+        def compute(value):
+            calls.append(value)
+            return value * 2
+
+        config = Config(config_root=CONFIG_TESTFILES_PATH)
+        config.from_mapping(MY_VAR=lazy(compute, 21), MY_VAR2=lazy(compute, 1))
+        assert calls == []
+
+        assert config['MY_VAR'] == 42
+        assert config.get('MY_VAR') == 42
+        assert config.get('MISSING', 'default') == 'default'
+        assert config.get_namespace('MY_') == dict(var=42, var2=2)
+        assert calls == [21, 1]
+
+    def test_config_attribute(self):
+        class App:
+            timeout = ConfigAttribute('TIMEOUT', get_converter=float)
+
+            def __init__(self):
+                self.config = dict(TIMEOUT=lazy(str, 3))
+
+        assert App().timeout == 3.0
+
+    def test_config_attribute_memoizes_until_written(self):
+        calls = []
+
+        def to_int(value):
+            calls.append(value)
+            return int(value)
+
+        class App:
+            batch_size = ConfigAttribute('BATCH_SIZE', get_converter=to_int)
+
+            def __init__(self, config):
+                self.config = config
+
+        config = Config(config_root=CONFIG_TESTFILES_PATH)
+        config['BATCH_SIZE'] = '100'
+        app = App(config)
+        assert app.batch_size == 100
+        assert app.batch_size == 100
+        assert calls == ['100']
+
+        app.batch_size = '250'
+        assert app.batch_size == 250
+        config.update(BATCH_SIZE='500')
+        assert app.batch_size == 500
+        assert calls == ['100', '250', '500']
+
+        app.config = Config(config_root=CONFIG_TESTFILES_PATH, defaults=dict(BATCH_SIZE='7'))
+        assert app.batch_size == 7
+
+    def test_config_attributes_sharing_a_key(self):
+        """ Attributes reading the same key with different converters each get their own value. """
+        class App:
+            timeout = ConfigAttribute('TIMEOUT', get_converter=float)
+            timeout_delta = ConfigAttribute('TIMEOUT', get_converter=lambda value: timedelta(seconds=value))
+
+            def __init__(self, config):
+                self.config = config
+
+        config = Config(config_root=CONFIG_TESTFILES_PATH)
+        config['TIMEOUT'] = 5
+        app = App(config)
+        assert app.timeout == 5.0
+        assert app.timeout_delta == timedelta(seconds=5)
+        assert app.timeout == 5.0
+
+    def test_thread_safe(self):
+        calls = []
+        start = threading.Barrier(8)
+
+        def compute():
+            calls.append(1)
+            return object()
+
+        value = lazy(compute)
+        results = []
+
+        def read():
+            start.wait()
+            results.append(value.resolve())
+
+        threads = [threading.Thread(target=read) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert len(calls) == 1
+        assert len({id(result) for result in results}) == 1
+
+
+class TestSnapshot(BasicConfigTestBase):
+    """ Test writing and loading config snapshots. """
+
+    def test_roundtrip(self, tmp_path):
+        self.config.from_pyfile(self.relative_path)
+        self.config['LAZY'] = lazy(dict, a=1)
+        path = str(tmp_path / "config.snapshot")
+        self.config.snapshot(path)
+
+        config = Config.from_snapshot(path)
+        self._assert_dev_config(config)
+        assert dict.__getitem__(config, 'LAZY') == dict(a=1)
+        assert config.config_root_dir == self.config.config_root_dir
+
+    def test_unpicklable_values_are_reported(self, tmp_path):
+        self.config['LOCK'] = threading.Lock()
+        self.config['FUNC'] = lambda: None
+        self.config['FINE'] = 1
+        path = tmp_path / "config.snapshot"
+        with pytest.raises(TypeError) as exc_info:
+            self.config.snapshot(str(path))
+        assert 'LOCK' in str(exc_info.value)
+        assert 'FUNC' in str(exc_info.value)
+        assert 'FINE' not in str(exc_info.value)
+        assert not path.exists()
+
+
+class TestLayeredConfig:
+    """ Test overlaying default, stage and env layers. """
+
+    @pytest.fixture
+    def config_dir(self, tmp_path):
+        (tmp_path / "default.py").write_text("DB_HOST = 'localhost'\nDB_PORT = 5432\nPOOL_SIZE = 4\n")
+        (tmp_path / "production.py").write_text(
+            "from common.config import lazy\nDB_HOST = 'db.internal'\nEXTRA = lazy(dict, a=1)\n"
+        )
+        return str(tmp_path)
+
+    def test_layers(self, config_dir):
+        config = LayeredConfig(config_dir, stage='production', env=dict(APP_POOL_SIZE='16', APP_OTHER='x'),
+                               env_prefix='APP_')
+        assert config['DB_HOST'] == 'db.internal'
+        assert config['DB_PORT'] == 5432
+        assert config['POOL_SIZE'] == '16'
+        assert config['EXTRA'] == dict(a=1)
+        assert 'OTHER' not in config
+        assert config.get('MISSING', 'default') == 'default'
+        assert config.get_namespace('DB_') == dict(host='db.internal', port=5432)
+
+        flat = config.flatten()
+        assert isinstance(flat, Config)
+        assert flat == dict(DB_HOST='db.internal', DB_PORT=5432, POOL_SIZE='16', EXTRA=dict(a=1))
+
+    def test_reload_layer(self, config_dir):
+        config = LayeredConfig(config_dir, stage='production', env={})
+        default = config.layer('default')
+        assert config['DB_HOST'] == 'db.internal'
+
+        with open(os.path.join(config_dir, "production.py"), "w") as stage_file:
+            stage_file.write("DB_HOST = 'db2.internal'\n")
+        config.reload_layer('stage')
+        assert config['DB_HOST'] == 'db2.internal'
+        assert 'EXTRA' not in config
+        assert config.layer('default') is default
+
+        config['DB_HOST'] = 'override'
+        assert config['DB_HOST'] == 'override'
+        with pytest.raises(ValueError):
+            config.reload_layer('nope')
+
+    def test_layer_writes_are_seen(self, config_dir):
+        """ Writing to a layer directly is not hidden by the lookup cache. """
+        config = LayeredConfig(config_dir, stage='production', env={})
+        assert config['DB_PORT'] == 5432
+        assert config.get_namespace('DB_')['port'] == 5432
+
+        config.layer('default')['DB_PORT'] = 6543
+        assert config['DB_PORT'] == 6543
+        assert config.flatten()['DB_PORT'] == 6543
+        assert config.get_namespace('DB_')['port'] == 6543
+
+    def test_without_default_file(self, tmp_path):
+        (tmp_path / "dev.py").write_text("MY_VAR = 1\n")
+        config = LayeredConfig(str(tmp_path), stage='dev', env={})
+        assert dict(config) == dict(MY_VAR=1)
@@ -53,6 +53,32 @@ def test_find_repo_root_with_root_dir():
     assert _is_root(refound)
 
 
+def test_find_repo_root_is_cached(tmp_path):
+    """ The parents are only walked again once a directory on the way to the root changes. """
+    package = tmp_path / "repo" / "package"
+    package.mkdir(parents=True)
+    (package / "__init__.py").write_text("")
+    config_utils.clear_discovery_cache()
+
+    assert config_utils.find_repo_root(str(package)) == tmp_path / "repo"
+    assert config_utils.find_repo_root(str(package)) == tmp_path / "repo"
+    (package / "__init__.py").unlink()
+    assert config_utils.find_repo_root(str(package)) == package
+
+    (package / "__init__.py").write_text("")
+    assert config_utils.find_repo_root(str(package)) == tmp_path / "repo"
+    (tmp_path / "repo" / "__init__.py").write_text("")
+    assert config_utils.find_repo_root(str(package)) == tmp_path
+    config_utils.clear_discovery_cache()
+    assert config_utils.find_repo_root(str(package)) == tmp_path
+
+
+def test_default_config_root():
+    """ Without a config_root, the config directory is found from the repo root. """
+    config = Config()
+    assert config.config_root_dir == str(config_utils.find_repo_root(os.getcwd()).joinpath("config"))
+
+
 def test_get_pyproject_config():
     """ Should return a config object. """
     config = config_utils.get_pyproject_config()
@@ -60,6 +86,25 @@ def test_get_pyproject_config():
     assert "tool.poetry" in config
 
 
+def test_get_pyproject_config_parses_toml(tmp_path):
+    """ Values are parsed as TOML, tables are reachable by dotted name, and parses are cached. """
+    pyproject = tmp_path / "pyproject.toml"
+    pyproject.write_text('[tool.poetry]\nname = "mine"\n\n[tool.poetry.dependencies]\npython = "~3.7"\n')
+    config_utils.clear_discovery_cache()
+
+    config = config_utils.get_pyproject_config(str(tmp_path))
+    assert config["tool.poetry"]["name"] == "mine"
+    assert config["tool"]["poetry"]["dependencies"]["python"] == "~3.7"
+    assert config["tool.poetry.dependencies"] == dict(python="~3.7")
+    assert "tool.black" not in config
+    assert config_utils.get_pyproject_config(str(tmp_path)) is config
+
+    stat = os.stat(pyproject)
+    pyproject.write_text('[tool.poetry]\nname = "renamed"\n')
+    os.utime(pyproject, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    assert config_utils.get_project_name(str(tmp_path)) == "renamed"
+
+
 def test_get_project_name():
     """ Should return the name of the current project. """
     name = config_utils.get_project_name()
@@ -105,6 +150,17 @@ class TestConfigFinder:
         assert 'default' in stages
         assert '__init__' not in stages
 
+    def test_allowed_stages_follow_the_directory(self, tmp_path):
+        """ Cached stages are refreshed when a config file is added. """
+        self._setup_config(tmp_path)
+        finder = config_utils.ConfigFinder(self.config_dir)
+        assert sorted(finder.get_allowed_stages()) == ['default', 'local']
+
+        stat = os.stat(self.config_dir)
+        (self.config_dir / "production.py").write_text("DEBUG = False")
+        os.utime(self.config_dir, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+        assert sorted(finder.get_allowed_stages()) == ['default', 'local', 'production']
+
     def test_get_stage(self, tmp_path, capsys):
         """ Should return the stage and print it to stdout. """
         self._setup_config(tmp_path)
@@ -1,11 +1,23 @@
 import types
 
+import pytest
+
+from common import enumerable
 from common.enumerable import all_combinations
 from common.enumerable import each_cons
 from common.enumerable import compact
+from common.enumerable import CombinationSpace
 from common.enumerable import each_slice
+from common.enumerable import each_slice_or_size
 from common.enumerable import group_by
+from common.enumerable import group_by_array
 from common.enumerable import index_by
+from common.enumerable import SequenceView
+
+
+def _mod_7(value):
+    # module level, so it can be sent to a process pool
+    return value % 7
 
 
 class TestGroupBy:
@@ -22,6 +34,34 @@ class TestGroupBy:
         expected = {'Bob': [self.BOB1, self.BOB2], 'Sally': [self.SALLY]}
         assert grouped == expected
 
+    def test_parallel(self):
+        """ Should match the sequential grouping, order included. """
+        values = list(range(100))
+        expected = group_by(_mod_7, values)
+        assert group_by(_mod_7, values, workers=2, chunk_size=9) == expected
+        assert list(group_by(_mod_7, values, parallel=True, chunk_size=9)) == list(expected)
+
+
+class TestGroupByArray:
+    """ Test the group_by_array function. """
+    KEYS = [3, 1, 3, 2, 1]
+    VALUES = ['a', 'b', 'c', 'd', 'e']
+
+    def test_numpy(self):
+        np = pytest.importorskip('numpy')
+        grouped = group_by_array(np.array(self.KEYS), np.array(self.VALUES))
+        assert list(grouped) == [1, 2, 3]
+        assert {key: group.tolist() for key, group in grouped.items()} == {1: ['b', 'e'], 2: ['d'], 3: ['a', 'c']}
+
+        indices = group_by_array(self.KEYS)
+        assert {key: group.tolist() for key, group in indices.items()} == {1: [1, 4], 2: [3], 3: [0, 2]}
+        assert group_by_array(np.array([], dtype=int)) == {}
+
+    def test_without_numpy(self, monkeypatch):
+        monkeypatch.setattr(enumerable, 'np', None)
+        assert group_by_array(self.KEYS, self.VALUES) == {1: ['b', 'e'], 2: ['d'], 3: ['a', 'c']}
+        assert group_by_array(self.KEYS) == {1: [1, 4], 2: [3], 3: [0, 2]}
+
 
 class TestIndexBy:
     """ Test the index_by function. """
@@ -37,6 +77,11 @@ class TestIndexBy:
         expected = {'Bob': self.BOB, 'Joe': self.JOE, 'Sally': self.SALLY}
         assert grouped == expected
 
+    def test_parallel(self):
+        """ Later values win, as in the sequential version. """
+        values = list(range(100))
+        assert index_by(_mod_7, values, workers=2, chunk_size=9) == index_by(_mod_7, values)
+
 
 class TestEachSlice:
     """ Test the each_slice function. """
@@ -49,6 +94,55 @@ class TestEachSlice:
         assert isinstance(response, types.GeneratorType)
         assert list(response) == expected
 
+    def test_list(self):
+        """ Lists are sliced rather than rebuilt, with the same results. """
+        assert list(each_slice(3, list(range(10)))) == [[0, 1, 2], [3, 4, 5], [6, 7, 8], [9]]
+
+    def test_views(self):
+        """ Sequences give views onto the input rather than copies. """
+        values = list(range(5))
+        chunks = list(each_slice(2, values, views=True))
+        assert all(isinstance(chunk, SequenceView) for chunk in chunks)
+        assert chunks == [[0, 1], [2, 3], [4]]
+        values[0] = 'changed'
+        assert chunks[0][0] == 'changed'
+
+        buffer_chunks = list(each_slice(2, b'abcde', views=True))
+        assert all(isinstance(chunk, memoryview) for chunk in buffer_chunks)
+        assert [chunk.tobytes() for chunk in buffer_chunks] == [b'ab', b'cd', b'e']
+        assert list(each_slice(2, iter(range(3)), views=True)) == [[0, 1], [2]]
+
+    def test_numpy_views(self):
+        np = pytest.importorskip('numpy')
+        array = np.arange(5)
+        chunks = list(each_slice(2, array, views=True))
+        assert [chunk.tolist() for chunk in chunks] == [[0, 1], [2, 3], [4]]
+        assert all(np.shares_memory(chunk, array) for chunk in chunks)
+
+
+class TestEachSliceOrSize:
+    """ Test the each_slice_or_size function. """
+
+    def test_max_len(self):
+        assert list(each_slice_or_size(range(5), max_len=2, max_bytes=100)) == [[0, 1], [2, 3], [4]]
+
+    def test_max_bytes(self):
+        """ Chunks are cut before the encoded size would go over max_bytes. """
+        items = ['abc', 'de', 'f', 'ghij']  # 5, 4, 3 and 6 bytes as JSON
+        assert list(each_slice_or_size(items, max_len=10, max_bytes=9)) == [['abc', 'de'], ['f', 'ghij']]
+
+    def test_size_func(self):
+        items = [b'ab', b'cd', b'e']
+        assert list(each_slice_or_size(items, max_len=10, max_bytes=4, size_func=len)) == [[b'ab', b'cd'], [b'e']]
+
+    def test_oversized(self):
+        items = [b'a', b'toolarge', b'b']
+        with pytest.raises(ValueError):
+            list(each_slice_or_size(items, max_len=10, max_bytes=4, size_func=len))
+
+        chunks = each_slice_or_size(items, max_len=10, max_bytes=4, size_func=len, emit_oversized=True)
+        assert list(chunks) == [[b'a'], [b'toolarge'], [b'b']]
+
 
 class TestAllCombinations:
     """ Test all_combinations. """
@@ -106,6 +200,38 @@ class TestAllCombinations:
         assert list(combinations) == self.EXPECTED['no_kwargs']
 
 
+class TestCombinationSpace:
+    """ Test CombinationSpace. """
+
+    def test_matches_all_combinations(self):
+        """ Same combinations in the same order, with random access. """
+        for kwargs in [dict(), dict(min_size=0), dict(min_size=2, max_size=3), dict(min_size=3, max_size=1)]:
+            space = CombinationSpace(range(7), **kwargs)
+            expected = list(all_combinations(range(7), **kwargs))
+            assert list(space) == expected
+            assert len(space) == len(expected)
+            assert [space[index] for index in range(len(space))] == expected
+
+    def test_indexing(self):
+        space = CombinationSpace('abcd')
+        assert space[-1] == ('a', 'b', 'c', 'd')
+        assert list(space[3:6]) == [('d',), ('a', 'b'), ('a', 'c')]
+        assert space[3:6][1] == ('a', 'b')
+        assert space[::5] == [('a',), ('a', 'c'), ('a', 'b', 'c')]
+        with pytest.raises(IndexError):
+            space[len(space)]
+
+    def test_partition(self):
+        """ Parts are contiguous and together cover the space. """
+        space = CombinationSpace(range(8), min_size=0)
+        parts = space.partition(3)
+        assert [len(part) for part in parts] == [86, 85, 85]
+        assert [combination for part in parts for combination in part] == list(space)
+        assert sum(len(part) for part in CombinationSpace(range(2)).partition(5)) == 3
+        with pytest.raises(ValueError):
+            space.partition(0)
+
+
 class TestEachCons:
     """ Test the each_cons function. """
     EXPECTED = [(1, 2, 3), (2, 3, 4), (3, 4, 5), (4, 5, 6)]
@@ -117,6 +243,38 @@ class TestEachCons:
         """ Should yield a window slice of tuples along the iterable. """
         assert list(each_cons(3, self.iterable)) == self.EXPECTED
 
+    def test_large_window(self):
+        """ Large windows (kept in a ring buffer) give the same tuples. """
+        values = list(range(40))
+        expected = [tuple(values[start:start + 20]) for start in range(21)]
+        assert list(each_cons(20, values)) == expected
+        assert list(each_cons(20, iter(values))) == expected
+
+    def test_views(self):
+        """ Windows on sequences are views onto the input rather than copies. """
+        windows = list(each_cons(3, self.iterable, views=True))
+        assert all(isinstance(window, SequenceView) for window in windows)
+        assert windows == [list(window) for window in self.EXPECTED]
+        assert windows[1][1:] == [3, 4]
+        assert windows[1][-1] == 4
+
+        assert [window.tobytes() for window in each_cons(2, b'abc', views=True)] == [b'ab', b'bc']
+        assert list(each_cons(3, iter(self.iterable), views=True)) == self.EXPECTED
+
+    def test_numpy_views(self):
+        np = pytest.importorskip('numpy')
+        array = np.array(self.iterable)
+        windows = list(each_cons(3, array, views=True))
+        assert [window.tolist() for window in windows] == [list(window) for window in self.EXPECTED]
+        assert all(np.shares_memory(window, array) for window in windows)
+        assert list(each_cons(10, array, views=True)) == []
+
+        rows = np.arange(8).reshape(4, 2)
+        windows = list(each_cons(2, rows, views=True))
+        assert [window.shape for window in windows] == [(2, 2)] * 3
+        assert windows[1].tolist() == rows[1:3].tolist()
+        assert all(np.shares_memory(window, rows) for window in windows)
+
 
 class TestCompact:
     """ Test the compact function. """